@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import argparse
+import resource
+import functools
+from contextlib import redirect_stdout
+
+import db
+import etl
+from create_tables import create_database, drop_tables, create_tables, create_indexes
+from sql_queries import (staging_songs_table_truncate, staging_songs_copy, staged_song_queries,
+                         staging_events_table_truncate, staging_events_copy, staged_log_queries)
+from song_index import SongIndex
+from time_dimension import TimeDimension
+
+TABLES = ['songplays', 'users', 'songs', 'artists', 'time']
+
+
+def count_rows(cur):
+    """
+    Returns:
+        total number of rows across the star schema tables
+    """
+    cur.execute(' UNION ALL '.join('SELECT COUNT(*) FROM {}'.format(table) for table in TABLES))
+    return sum(count for count, in cur.fetchall())
+
+
+def reset_peak_memory():
+    """
+    - Resets the process peak resident set size so the next reading covers one stage only,
+      where the platform does not allow this the reading is the peak since start up
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_memory():
+    """
+    Returns:
+        peak resident set size of the process in bytes
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_stage(name, conn, func, quiet=True):
+    """
+    - Runs one stage of the ETL and measures it
+    Args:
+        name (str): label for the report
+        conn (db.SessionConnection): connection the stage writes through
+        func (python function): callable running the stage
+        quiet (bool): hide the per-file progress output of the stage
+    Returns:
+        dict with seconds, rows written, rows/sec, round trips and peak resident memory
+    """
+    cur = conn.cursor()
+    rows_before = count_rows(cur)
+    conn.commit()
+    round_trips = conn.round_trips
+
+    reset_peak_memory()
+    start = time.perf_counter()
+    if quiet:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            func()
+    else:
+        func()
+    seconds = time.perf_counter() - start
+    peak = peak_memory()
+
+    round_trips = conn.round_trips - round_trips
+    rows = count_rows(cur) - rows_before
+    conn.commit()
+
+    return {
+        'stage': name,
+        'seconds': round(seconds, 3),
+        'rows': rows,
+        'rows_per_sec': round(rows / seconds, 1) if seconds else None,
+        'round_trips': round_trips,
+        'peak_memory_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def reset_database(config):
+    """
+    - Recreates the benchmark database and its tables so every mode starts empty
+    - The secondary indexes are left out, `benchmark_mode` builds them once song_data is loaded
+      as `etl.py --create-indexes` does
+    """
+    cur, conn = create_database(config)
+    drop_tables(cur, conn)
+    create_tables(cur, conn)
+    conn.close()
+
+
+def benchmark_mode(config, mode, song_dir, log_dir):
+    """
+    - Loads song_dir and log_dir into a fresh database with the row, bulk or staging code path,
+      building the secondary indexes between the song and log stages
+    - `bulk` matches songplays with one query per event like `etl.py --mode bulk`,
+      `bulk-song-index` against the in-memory song index like `etl.py --mode bulk --song-index`
+    Args:
+        config (configparser.ConfigParser): settings with DB_NAME pointing at the benchmark database
+        mode (str): `row`, `bulk`, `bulk-song-index` or `staging`
+        song_dir (str): directory of song_data
+        log_dir (str): directory of log_data
+    Returns:
+        list of stage results from `run_stage`, the last one covering process_data end to end
+    """
+    reset_database(config)
+    conn = db.connect(config)
+    db.prepare_statements(conn)
+    cur = conn.cursor()
+
+    if mode == 'row':
+        song_stage = functools.partial(etl.process_data, cur, conn, song_dir, etl.process_song_file)
+        log_stage = functools.partial(etl.process_data, cur, conn, log_dir, etl.process_log_file)
+    elif mode == 'staging':
+        db.apply_session_settings(conn, config['BULK_SESSION'])
+        song_stage = functools.partial(etl.process_data_staged, cur, conn, song_dir, staging_songs_table_truncate, staging_songs_copy, staged_song_queries)
+        log_stage = functools.partial(etl.process_data_staged, cur, conn, log_dir, staging_events_table_truncate, staging_events_copy, staged_log_queries, batch_files=10)
+    else:
+        db.apply_session_settings(conn, config['BULK_SESSION'])
+        song_stage = functools.partial(etl.process_data_coalesced, cur, conn, song_dir, etl.transform_song_files, etl.load_song_batch)
+
+        def log_stage():
+            song_index = None
+            if mode == 'bulk-song-index':
+                song_index = SongIndex()
+                song_index.refresh(cur)
+            time_dimension = TimeDimension()
+            time_dimension.refresh(cur)
+            load = functools.partial(etl.load_log_batch, song_index=song_index, time_dimension=time_dimension)
+            etl.process_data_coalesced(cur, conn, log_dir, etl.transform_log_files, load, batch_files=10)
+
+    results = [
+        run_stage('{} process_song_file'.format(mode), conn, song_stage),
+        run_stage('{} create_indexes'.format(mode), conn, functools.partial(create_indexes, cur, conn)),
+        run_stage('{} process_log_file'.format(mode), conn, log_stage),
+    ]
+    conn.close()
+
+    total_seconds = sum(r['seconds'] for r in results)
+    total_rows = sum(r['rows'] for r in results)
+    results.append({
+        'stage': '{} process_data'.format(mode),
+        'seconds': round(total_seconds, 3),
+        'rows': total_rows,
+        'rows_per_sec': round(total_rows / total_seconds, 1) if total_seconds else None,
+        'round_trips': sum(r['round_trips'] for r in results),
+        'peak_memory_mb': max(r['peak_memory_mb'] for r in results),
+    })
+
+    return results
+
+
+def print_report(results):
+    """
+    - Prints the stage results as a table
+    """
+    columns = ['stage', 'seconds', 'rows', 'rows_per_sec', 'round_trips', 'peak_memory_mb']
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print('  '.join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    """
+    - Times the Postgres ETL end to end against a local database, one fresh load per mode
+    - Run generate_data.py first to produce a larger dataset than the sample in data/
+    Usage:
+        python benchmark.py [--data DIR] [--modes row bulk bulk-song-index staging] [--database NAME] [--output report.json]
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the Postgres ETL')
+    parser.add_argument('--data', default='data', help='directory holding song_data and log_data')
+    parser.add_argument('--modes', nargs='+', choices=['row', 'bulk', 'bulk-song-index', 'staging'], default=['row', 'bulk', 'bulk-song-index', 'staging'], help='code paths to benchmark')
+    parser.add_argument('--database', default='sparkify_benchmark', help='database created (and dropped) for the benchmark')
+    parser.add_argument('--config', default=db.CONFIG_FILE, help='config file with the POSTGRES settings')
+    parser.add_argument('--output', default=None, help='also write the results to this json file')
+    args = parser.parse_args()
+
+    config = db.load_config(args.config)
+    config['POSTGRES']['DB_NAME'] = args.database
+
+    song_dir = os.path.join(args.data, 'song_data')
+    log_dir = os.path.join(args.data, 'log_data')
+
+    results = []
+    for mode in args.modes:
+        results.extend(benchmark_mode(config, mode, song_dir, log_dir))
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
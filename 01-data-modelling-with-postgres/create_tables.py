@@ -1,27 +1,34 @@
-import psycopg2
-from sql_queries import create_table_queries, drop_table_queries
+import argparse
+import db
+from sql_queries import (create_table_queries, create_index_queries, drop_table_queries,
+                         songplay_table_create, songplay_partitioned_table_create, songplay_start_time_brin_index_create,
+                         foreign_keys, foreign_key_create, foreign_key_create_not_valid, foreign_key_validate,
+                         foreign_key_violations_select, foreign_key_select, songplay_partitioned_select)
 
 
-def create_database():
+def create_database(config=None):
     """
     - Creates and connects to the sparkifydb
     - Returns the connection and cursor to sparkifydb
+    Args:
+        config (configparser.ConfigParser): settings from `db.load_config`
     """
+    config = config or db.load_config()
     
     # connect to default database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=studentdb user=student password=student")
+    conn = db.connect(config, dbname=config['POSTGRES']['DEFAULT_DB'])
     conn.set_session(autocommit=True)
     cur = conn.cursor()
     
     # create sparkify database with UTF8 encoding
-    cur.execute("DROP DATABASE IF EXISTS sparkifydb")
-    cur.execute("CREATE DATABASE sparkifydb WITH ENCODING 'utf8' TEMPLATE template0")
+    cur.execute("DROP DATABASE IF EXISTS {}".format(config['POSTGRES']['DB_NAME']))
+    cur.execute("CREATE DATABASE {} WITH ENCODING 'utf8' TEMPLATE template0".format(config['POSTGRES']['DB_NAME']))
     
     # close connection to default database
     conn.close()    
     
     # connect to sparkify database
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    conn = db.connect(config)
     cur = conn.cursor()
     
     return cur, conn
@@ -36,14 +43,68 @@ def drop_tables(cur, conn):
         conn.commit()
 
 
-def create_tables(cur, conn):
+def create_tables(cur, conn, partition_songplays=False, defer_constraints=False):
     """
     Creates each table using the queries in `create_table_queries` list. 
+    With partition_songplays, songplays is range partitioned by month on start_time with a BRIN index on start_time.
+    With defer_constraints, the foreign keys are left out until `create_foreign_keys` runs after the load.
     """
     for query in create_table_queries:
+        if partition_songplays and query == songplay_table_create:
+            query = songplay_partitioned_table_create
         cur.execute(query)
         conn.commit()
 
+    if partition_songplays:
+        cur.execute(songplay_start_time_brin_index_create)
+        conn.commit()
+
+    if not defer_constraints:
+        create_foreign_keys(cur, conn)
+
+
+def create_indexes(cur, conn):
+    """
+    Creates the secondary indexes in the `create_index_queries` list, existing ones are left as they are.
+    """
+    for query in create_index_queries:
+        cur.execute(query)
+        conn.commit()
+
+
+def create_foreign_keys(cur, conn):
+    """
+    Adds each foreign key in the `foreign_keys` list that is not in place yet, or validates it if it was added NOT VALID.
+    The rows already loaded are checked first: a key with orphan rows is added NOT VALID so it holds for new rows
+    (left out on partitioned songplays, which does not support NOT VALID keys) and reported instead of failing the load.
+    Returns a dict of constraint name to a list of (orphan value, rows) for every key with violations.
+    """
+    cur.execute(songplay_partitioned_select)
+    partitioned = cur.fetchone()[0]
+
+    violations = {}
+    for table, name, column, ref_table, ref_column in foreign_keys:
+        names = dict(table=table, name=name, column=column, ref_table=ref_table, ref_column=ref_column)
+
+        cur.execute(foreign_key_select, (name, table))
+        existing = cur.fetchone()
+        if existing and existing[0]:
+            continue
+
+        cur.execute(foreign_key_violations_select.format(**names))
+        orphans = cur.fetchall()
+        if orphans:
+            violations[name] = orphans
+            if not existing and not (partitioned and table == 'songplays'):
+                cur.execute(foreign_key_create_not_valid.format(**names))
+        elif existing:
+            cur.execute(foreign_key_validate.format(**names))
+        else:
+            cur.execute(foreign_key_create.format(**names))
+        conn.commit()
+
+    return violations
+
 
 def main():
     """
@@ -56,12 +117,27 @@ def main():
     
     - Creates all tables needed. 
     
+    - Creates the foreign keys and secondary indexes, unless they are deferred until after the bulk load. 
+    
     - Finally, closes the connection. 
+    Usage:
+        python create_tables.py [--defer-indexes] [--bulk-load] [--partition-songplays]
     """
+    parser = argparse.ArgumentParser(description='Create the sparkify database and tables')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='leave out the secondary indexes, run etl.py --create-indexes to build them once the songs are loaded')
+    parser.add_argument('--bulk-load', action='store_true',
+                        help='leave out the foreign keys and secondary indexes, run etl.py --add-constraints to add and validate them after the load')
+    parser.add_argument('--partition-songplays', action='store_true',
+                        help='create songplays partitioned by month, etl.py adds partitions as new months are loaded')
+    args = parser.parse_args()
+
     cur, conn = create_database()
     
     drop_tables(cur, conn)
-    create_tables(cur, conn)
+    create_tables(cur, conn, args.partition_songplays, defer_constraints=args.bulk_load)
+    if not (args.defer_indexes or args.bulk_load):
+        create_indexes(cur, conn)
 
     conn.close()
 
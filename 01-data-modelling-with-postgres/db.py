@@ -0,0 +1,146 @@
+import os
+import re
+import configparser
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+from sql_queries import prepared_queries
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sparkify.cfg')
+
+DEFAULT_CONFIG = {
+    'POSTGRES': {
+        'HOST': '127.0.0.1',
+        'PORT': '5432',
+        'DEFAULT_DB': 'studentdb',
+        'DB_NAME': 'sparkifydb',
+        'DB_USER': 'student',
+        'DB_PASSWORD': 'student',
+    },
+    'BULK_SESSION': {},
+}
+
+
+class SessionConnection(psycopg2.extensions.connection):
+    """
+    - psycopg2 connection that remembers the statements prepared on its server session
+    - Cursors it creates run those statements with EXECUTE instead of re-sending the sql
+    - Counts the round trips made through it in `round_trips`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}
+        self.round_trips = 0
+        self.cursor_factory = PreparedCursor
+
+    def commit(self):
+        self.round_trips += 1
+        return super().commit()
+
+
+class PreparedCursor(psycopg2.extensions.cursor):
+    """
+    - Cursor that swaps any query prepared on its connection for the matching EXECUTE
+    - Adds each statement it sends to the connection's round trip count
+    """
+
+    def _count(self, n=1):
+        if hasattr(self.connection, 'round_trips'):
+            self.connection.round_trips += n
+
+    def execute(self, query, params=None):
+        self._count()
+        prepared = getattr(self.connection, 'prepared', None)
+        if prepared and isinstance(query, str) and query in prepared:
+            query = prepared[query]
+        return super().execute(query, params)
+
+    def executemany(self, query, params_list):
+        params_list = list(params_list)
+        self._count(len(params_list))
+        return super().executemany(query, params_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        self._count()
+        return super().copy_expert(sql, file, size)
+
+
+def load_config(path=CONFIG_FILE):
+    """
+    - Reads the connection and session settings, falling back to the
+      local student database defaults for anything missing
+    Args:
+        path (str): filepath for the config file
+    Returns:
+        configparser.ConfigParser with the POSTGRES and BULK_SESSION sections
+    """
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_CONFIG)
+    config.read(path)
+
+    return config
+
+
+def get_dsn(config, dbname=None):
+    """
+    Args:
+        config (configparser.ConfigParser): settings from `load_config`
+        dbname (str): database to connect to, defaults to DB_NAME
+    Returns:
+        libpq connection string
+    """
+    postgres = config['POSTGRES']
+
+    return "host={} port={} dbname={} user={} password={}".format(
+        postgres['HOST'], postgres['PORT'], dbname or postgres['DB_NAME'], postgres['DB_USER'], postgres['DB_PASSWORD'])
+
+
+def connect(config=None, dbname=None):
+    """
+    - Opens a connection to the sparkify database, or to dbname
+    Args:
+        config (configparser.ConfigParser): settings from `load_config`
+        dbname (str): database to connect to, defaults to DB_NAME
+    Returns:
+        SessionConnection
+    """
+    config = config or load_config()
+
+    return psycopg2.connect(get_dsn(config, dbname), connection_factory=SessionConnection)
+
+
+def apply_session_settings(conn, settings):
+    """
+    - Sets run-time parameters for the connection's session, e.g. the BULK_SESSION section
+    Args:
+        conn (psycopg2.connect()): connection to the database
+        settings (mapping): parameter name to value
+    """
+    cur = conn.cursor()
+    for name, value in settings.items():
+        cur.execute(sql.SQL("SET {} TO {}").format(sql.Identifier(name), sql.Literal(value)))
+    conn.commit()
+
+
+def prepare_statements(conn, queries=prepared_queries):
+    """
+    - Prepares each query once on the connection's server session
+    - Afterwards `cur.execute(query, params)` with one of these queries sends only
+      EXECUTE and the parameters, so the statement is parsed and planned once
+    Args:
+        conn (SessionConnection): connection to the database
+        queries (dict): statement name to sql using %s placeholders
+    """
+    cur = conn.cursor()
+    for name, query in queries.items():
+        if query in conn.prepared:
+            continue
+
+        counter = iter(range(1, query.count('%s') + 1))
+        body = re.sub(r'%s', lambda match: '${}'.format(next(counter)), query).strip().rstrip(';')
+        cur.execute('PREPARE {} AS {}'.format(name, body))
+
+        params = ', '.join(['%s'] * query.count('%s'))
+        conn.prepared[query] = 'EXECUTE {} ({})'.format(name, params) if params else 'EXECUTE {}'.format(name)
+    conn.commit()
@@ -1,128 +1,701 @@
+import io
 import os
+import re
 import glob
-import psycopg2
+import time
+import cProfile
+import argparse
+import functools
+import itertools
 import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from psycopg2.extras import execute_values
+import db
 from sql_queries import *
+from create_tables import create_indexes, create_foreign_keys
+from song_index import SongIndex
+from manifest import select_new_files, record_file, read_text
+from time_dimension import TimeDimension, build_time_rows
+from staging import copy_files, run_staged_inserts
+from partitions import SongplayPartitions
+import instrumentation
+from instrumentation import stage, source_file, record_write, count
+
+
+def execute_insert(cur, table, query, data):
+    """
+    - Runs a single-row insert and records its timing and outcome for the run report
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        table (str): table the query inserts into
+        query (str): insert query
+        data (sequence): values for the query
+    """
+    with stage('write.' + table):
+        cur.execute(query, data)
+    record_write(table, 1, cur.rowcount)
 
 
 def process_song_file(cur, filepath):
     """
     - Reads song data in each file, extract the relevant columns
-    - Inserts the data into the songs and artist tables
+    - Inserts the data into the artist and songs tables, the artist first so the song's
+      match_key is set as it is inserted
     Args:
         cur (psycopg2.cursor()): cursor for the database
         filepath (str): filepath for the file
     """
 
     # open song file
-    df = pd.read_json(filepath, lines=True)
+    with stage('read'):
+        df = pd.read_json(io.StringIO(read_text(filepath)), lines=True)
 
-    # insert song record
-    song_data = df[['song_id', 'title', 'artist_id', 'year', 'duration']].values[0].tolist() 
-    cur.execute(song_table_insert, song_data)
-    
     # insert artist record
-    artist_data = df[['artist_id', 'artist_name', 'artist_location', 'artist_latitude', 'artist_longitude']].values[0].tolist()
-    cur.execute(artist_table_insert, artist_data)
+    with stage('transform'):
+        artist_data = df[['artist_id', 'artist_name', 'artist_location', 'artist_latitude', 'artist_longitude']].values[0].tolist()
+    execute_insert(cur, 'artists', artist_table_insert, artist_data)
+
+    # insert song record
+    with stage('transform'):
+        song_data = df[['song_id', 'title', 'artist_id', 'year', 'duration']].values[0].tolist() 
+    execute_insert(cur, 'songs', song_table_insert, song_data)
 
 
-def process_log_file(cur, filepath):
+def process_log_file(cur, filepath, partitions=None):
     """
     - Reads the data from the log file filtering for Next Song actions only
     - Converts the timestamp into the relevant time columns
     - Inserts the transformed datetime data into the time table
     - Inserts relevant columns into user and songplay tables
+    - Adds the file's play counts to the rollups with one upsert per table rather than
+      letting the rollups trigger fire for every songplay
     Args:
         cur (psycopg2.cursor()): cursor for the database
         filepath (str): filepath for the file
+        partitions (SongplayPartitions): optional, creates the songplays partitions the file needs
     """
 
     # open log file
-    df = pd.read_json(filepath, lines=True)
+    with stage('read'):
+        df = pd.read_json(io.StringIO(read_text(filepath)), lines=True)
 
-    # filter by NextSong action
-    df = df[df['page'] == 'NextSong']
+    with stage('transform'):
+        # filter by NextSong action
+        df = df[df['page'] == 'NextSong']
 
-    # convert timestamp column to datetime
-    t = pd.to_datetime(df.ts, unit='ms')
+        # convert timestamp column to datetime
+        t = pd.to_datetime(df.ts, unit='ms')
     
-    # insert time data records
-    time_data = pd.concat([t, t.dt.hour, t.dt.day, t.dt.isocalendar().week, t.dt.month, t.dt.year, t.dt.weekday], axis=1)
-    column_labels = (['start_time', 'hour', 'day', 'week_of_year', 'month', 'year', 'weekday'])
-    time_data.columns = column_labels
-    time_df = time_data
+        # insert time data records
+        time_data = pd.concat([t, t.dt.hour, t.dt.day, t.dt.isocalendar().week, t.dt.month, t.dt.year, t.dt.weekday], axis=1)
+        column_labels = (['start_time', 'hour', 'day', 'week_of_year', 'month', 'year', 'weekday'])
+        time_data.columns = column_labels
+        time_df = time_data
 
     for i, row in time_df.iterrows():
-        cur.execute(time_table_insert, list(row))
+        execute_insert(cur, 'time', time_table_insert, list(row))
 
     # load user table
-    user_df = df[['userId', 'firstName', 'lastName', 'gender', 'level']]
-    column_labels = (['user_id', 'first_name', 'last_name', 'gender', 'level'])
-    user_df.columns = column_labels
+    with stage('transform'):
+        user_df = df[['userId', 'firstName', 'lastName', 'gender', 'level']]
+        column_labels = (['user_id', 'first_name', 'last_name', 'gender', 'level'])
+        user_df.columns = column_labels
 
     # insert user records
     for i, row in user_df.iterrows():
-        cur.execute(user_table_insert, row)
+        execute_insert(cur, 'users', user_table_insert, row)
+
+    if partitions is not None:
+        partitions.ensure_for_timestamps(cur, df['ts'])
+
+    # the rollups trigger is off until the file is committed, its deltas are added below
+    cur.execute(rollups_defer_set)
+    cur.execute(songplay_max_id_select)
+    last_songplay_id = cur.fetchone()[0]
 
     # insert songplay records
     for index, row in df.iterrows():
         
         # get songid and artistid from song and artist tables
-        cur.execute(song_select, (row.song, row.artist, row.length))
-        results = cur.fetchone()
+        with stage('lookup'):
+            cur.execute(song_select, (row.song, row.artist, row.length))
+            results = cur.fetchone()
         
         if results:
             songid, artistid = results
         else:
             songid, artistid = None, None
+            count('unmatched_songplays')
 
         # insert songplay record
         songplay_data = (pd.to_datetime(row.ts, unit='ms'), int(row.userId), row.level, songid, artistid, row.sessionId, row.location, row.userAgent)
-        cur.execute(songplay_table_insert, songplay_data)
+        execute_insert(cur, 'songplays', songplay_table_insert, songplay_data)
+
+    with stage('write.rollups'):
+        cur.execute(rollup_deltas_after_upsert, {'after': last_songplay_id})
 
 
-def process_data(cur, conn, filepath, func):
+def bulk_insert(cur, query, rows, page_size=1000):
     """
-    - Iterates through all the files found in the director and processes them
+    - Sends the rows to the database as multi-row VALUES statements of up to page_size rows
     Args:
         cur (psycopg2.cursor()): cursor for the database
-        conn (psycopg2.connect()): connection to the database
-        filepath (str): filepath for the directory
-        func (python function): function which processes each file
+        query (str): insert query with a single `VALUES %s` placeholder
+        rows (list): list of row tuples matching the query columns
+        page_size (int): maximum number of rows per statement
     Returns:
-        Number of current file being processed / total files in directory
+        Number of rows inserted or updated (rows skipped by ON CONFLICT DO NOTHING are not counted)
+    """
+    table = re.search(r'INSERT INTO (\w+)', query).group(1)
+
+    written, statements = 0, 0
+    with stage('write.' + table):
+        for start in range(0, len(rows), page_size):
+            execute_values(cur, query, rows[start:start + page_size], page_size=page_size)
+            written += cur.rowcount
+            statements += 1
+    record_write(table, len(rows), written, statements)
+
+    return written
+
+
+def transform_song_file(filepath):
+    """
+    - Reads song data in the file and extracts the song and artist rows
+    Args:
+        filepath (str): filepath for the file
+    Returns:
+        dict with `songs` and `artists` row lists
+    """
+
+    # open song file
+    with stage('read'):
+        df = pd.read_json(io.StringIO(read_text(filepath)), lines=True)
+
+    with stage('transform'):
+        song_rows = list(df[['song_id', 'title', 'artist_id', 'year', 'duration']].itertuples(index=False, name=None))
+        artist_rows = list(df[['artist_id', 'artist_name', 'artist_location', 'artist_latitude', 'artist_longitude']].itertuples(index=False, name=None))
+
+    return {'songs': song_rows, 'artists': artist_rows}
+
+
+def load_song_batch(cur, batch, page_size=1000):
+    """
+    - Inserts the artist and song rows of the batch as one bulk statement per table, the
+      artists first so the songs' match_key is set as they are inserted
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        batch (dict): rows produced by `transform_song_file` or `transform_song_files`
+        page_size (int): maximum number of rows per statement
+    Returns:
+        Number of rows written to the songs and artists tables
+    """
+    written = bulk_insert(cur, artist_table_bulk_insert, batch['artists'], page_size)
+    written += bulk_insert(cur, song_table_bulk_insert, batch['songs'], page_size)
+
+    return written
+
+
+def read_json_files(filepaths):
+    """
+    - Concatenates the json lines of many files and parses them with a single `pd.read_json`
+      so the values come out exactly as they would when each file is read on its own
+    Args:
+        filepaths (list): filepaths for the files
+    Returns:
+        dataframe holding the records of every file
+    """
+    with stage('read'):
+        lines = []
+        for filepath in filepaths:
+            lines.extend(line for line in read_text(filepath).splitlines() if line.strip())
+
+        return pd.read_json(io.StringIO('\n'.join(lines)), lines=True)
+
+
+def transform_song_files(filepaths):
     """
+    - Reads the records of many song files into one columnar batch
+    - Drops repeated song_id and artist_id keeping the first, as ON CONFLICT DO NOTHING would
+    Args:
+        filepaths (list): filepaths for the files
+    Returns:
+        dict with `songs` and `artists` row lists
+    """
+    df = read_json_files(filepaths)
+
+    with stage('transform'):
+        song_rows = list(df[['song_id', 'title', 'artist_id', 'year', 'duration']].drop_duplicates('song_id').itertuples(index=False, name=None))
+        artist_rows = list(df[['artist_id', 'artist_name', 'artist_location', 'artist_latitude', 'artist_longitude']].drop_duplicates('artist_id').itertuples(index=False, name=None))
+
+    return {'songs': song_rows, 'artists': artist_rows}
+
+
+def transform_log_frame(df):
+    """
+    - Filters the log records for Next Song actions only
+    - Builds the user and songplay rows in memory and keeps the raw event timestamps
+      for the time table
+    Args:
+        df (pandas.DataFrame): log records
+    Returns:
+        dict with `ts` (epoch milliseconds of every event), `users` and `songplays` row lists,
+        songplay rows still carry the (song, artist, length) columns needed to look up
+        song_id and artist_id
+    """
+
+    with stage('transform'):
+        # filter by NextSong action
+        df = df[df['page'] == 'NextSong']
+        df = df.assign(userId=df['userId'].astype(int))
+
+        # convert timestamp column to datetime
+        t = pd.to_datetime(df.ts, unit='ms')
+
+        # user rows, keeping the last occurrence of each user so the latest level wins
+        # as it does when the rows are upserted one at a time
+        user_df = df[['userId', 'firstName', 'lastName', 'gender', 'level']].drop_duplicates('userId', keep='last')
+        user_rows = list(user_df.itertuples(index=False, name=None))
+
+        # songplay rows
+        songplay_df = df[['level', 'sessionId', 'location', 'userAgent', 'song', 'artist', 'length', 'userId']].assign(start_time=t)
+        songplay_rows = list(songplay_df[['start_time', 'userId', 'level', 'sessionId', 'location', 'userAgent', 'song', 'artist', 'length']].itertuples(index=False, name=None))
+
+    return {'ts': df['ts'].to_numpy(dtype='int64'), 'users': user_rows, 'songplays': songplay_rows}
+
+
+def transform_log_file(filepath):
+    """
+    - Reads the data from the log file and builds its rows with `transform_log_frame`
+    Args:
+        filepath (str): filepath for the file
+    Returns:
+        dict of rows as returned by `transform_log_frame`
+    """
+    with stage('read'):
+        df = pd.read_json(io.StringIO(read_text(filepath)), lines=True)
+
+    return transform_log_frame(df)
+
 
-    # get all files matching extension from directory
+def transform_log_files(filepaths):
+    """
+    - Reads many log files into one frame and builds their rows with `transform_log_frame`
+    Args:
+        filepaths (list): filepaths for the files
+    Returns:
+        dict of rows as returned by `transform_log_frame`
+    """
+    return transform_log_frame(read_json_files(filepaths))
+
+
+def load_log_batch(cur, batch, page_size=1000, song_index=None, time_dimension=None, partitions=None):
+    """
+    - Looks up song_id and artist_id for each songplay
+    - Inserts the time, user and songplay rows of the batch as one bulk statement per table
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        batch (dict): rows produced by `transform_log_file` or `transform_log_files`
+        page_size (int): maximum number of rows per statement
+        song_index (SongIndex): optional in-memory lookup used instead of `song_select`
+        time_dimension (TimeDimension): optional cache so only unseen timestamps are sent
+        partitions (SongplayPartitions): optional, creates the songplays partitions the batch needs
+    Returns:
+        Number of rows written to the time, users and songplays tables
+    """
+
+    # get songid and artistid from the song index or the song and artist tables
+    songplay_rows = []
+    with stage('lookup'):
+        for start_time, user_id, level, session_id, location, user_agent, song, artist, length in batch['songplays']:
+            if song_index is not None:
+                songid, artistid = song_index.lookup(song, artist, length, cur)
+            else:
+                cur.execute(song_select, (song, artist, length))
+                results = cur.fetchone()
+
+                if results:
+                    songid, artistid = results
+                else:
+                    songid, artistid = None, None
+
+            if songid is None:
+                count('unmatched_songplays')
+
+            songplay_rows.append((start_time, user_id, level, songid, artistid, session_id, location, user_agent))
+
+    if time_dimension is not None:
+        with stage('write.time'):
+            written = time_dimension.load(cur, batch['ts'], page_size)
+        record_write('time', len(batch['ts']), written, -(-written // page_size))
+    else:
+        written = bulk_insert(cur, time_table_bulk_insert, build_time_rows(pd.unique(batch['ts'])), page_size)
+    written += bulk_insert(cur, user_table_bulk_insert, batch['users'], page_size)
+    if partitions is not None:
+        partitions.ensure_for_timestamps(cur, batch['ts'])
+    written += bulk_insert(cur, songplay_table_bulk_insert, songplay_rows, page_size)
+
+    return written
+
+
+def get_files(filepath):
+    """
+    - Collects every json file below the directory
+    Args:
+        filepath (str): filepath for the directory
+    Returns:
+        list of absolute filepaths
+    """
     all_files = []
     for root, dirs, files in os.walk(filepath):
         files = glob.glob(os.path.join(root,'*.json'))
         for f in files :
             all_files.append(os.path.abspath(f))
 
+    return all_files
+
+
+def find_files(cur, conn, filepath, incremental=False):
+    """
+    - Collects the json files in the directory
+    - In incremental mode drops files recorded in the load manifest with unchanged contents,
+      keeps only the appended part of grown files and refuses files changed otherwise
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+        filepath (str): filepath for the directory
+        incremental (bool): skip files already loaded
+    Returns:
+        list of files to process, and dict of file to manifest row (None when not incremental)
+    """
+    all_files = get_files(filepath)
+    print('{} files found in {}'.format(len(all_files), filepath))
+
+    if not incremental:
+        return all_files, None
+
+    cur.execute(load_manifest_table_create)
+    all_files, fingerprints, skipped, refused = select_new_files(cur, all_files, filepath)
+    conn.commit()
+    print('{} files already loaded and unchanged, skipped'.format(len(skipped)))
+    appended = sum(1 for f in all_files if getattr(f, 'offset', 0))
+    if appended:
+        print('{} files appended to since they were loaded, loading their new lines only'.format(appended))
+    for f in refused:
+        print('refused {}: changed other than by appending since it was loaded, '
+              'reloading it would duplicate its records, rebuild the tables with create_tables.py to load it'.format(f))
+
+    return all_files, fingerprints
+
+
+def process_data(cur, conn, filepath, func, incremental=False):
+    """
+    - Iterates through all the files found in the director and processes them
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+        filepath (str): filepath for the directory
+        func (python function): function which processes each file
+        incremental (bool): only process files that are new or changed since they were last loaded
+    Returns:
+        Number of current file being processed / total files in directory
+    """
+
+    # get all files matching extension from directory, leaving out files already loaded
+    all_files, fingerprints = find_files(cur, conn, filepath, incremental)
+
     # get total number of files found
     num_files = len(all_files)
-    print('{} files found in {}'.format(num_files, filepath))
 
     # iterate over files and process
     for i, datafile in enumerate(all_files, 1):
-        func(cur, datafile)
-        conn.commit()
+        with source_file(datafile):
+            func(cur, datafile)
+            if fingerprints is not None:
+                record_file(cur, fingerprints[datafile])
+            with stage('commit'):
+                conn.commit()
         print('{}/{} files processed.'.format(i, num_files))
 
 
+def process_data_coalesced(cur, conn, filepath, transform, load, batch_files=1000, incremental=False):
+    """
+    - Loads the files found in the directory batch_files at a time
+    - Each batch is read into one columnar frame, de-duplicated in memory and written
+      with one bulk statement per table, then committed
+    - Reports files/sec and rows/sec for the whole directory
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+        filepath (str): filepath for the directory
+        transform (python function): function turning a list of filepaths into a row batch
+        load (python function): function writing a row batch and returning the rows written
+        batch_files (int): number of files coalesced into each batch
+        incremental (bool): only process files that are new or changed since they were last loaded
+    """
+
+    # get all files matching extension from directory, leaving out files already loaded
+    all_files, fingerprints = find_files(cur, conn, filepath, incremental)
+
+    # get total number of files found
+    num_files = len(all_files)
+
+    start = time.perf_counter()
+    rows = 0
+    for i in range(0, num_files, batch_files):
+        batch_paths = all_files[i:i + batch_files]
+        with source_file(batch_paths):
+            rows += load(cur, transform(batch_paths))
+            if fingerprints is not None:
+                for datafile in batch_paths:
+                    record_file(cur, fingerprints[datafile])
+            with stage('commit'):
+                conn.commit()
+        print('{}/{} files processed.'.format(i + len(batch_paths), num_files))
+
+    elapsed = time.perf_counter() - start
+    if elapsed > 0:
+        print('{:.0f} files/sec, {:.0f} rows/sec'.format(num_files / elapsed, rows / elapsed))
+
+
+def process_data_parallel(cur, conn, filepath, transform, load, workers=None, queue_depth=None, incremental=False):
+    """
+    - Parses and transforms the files found in the directory on a pool of worker processes
+    - Applies the resulting row batches on the single writer connection in file order
+    - At most queue_depth files are in flight so memory stays bounded on large directories
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+        filepath (str): filepath for the directory
+        transform (python function): picklable function turning a filepath into a row batch
+        load (python function): function writing a row batch with the cursor
+        workers (int): number of worker processes, defaults to the number of cores
+        queue_depth (int): maximum number of files being transformed ahead of the writer,
+            defaults to twice the number of workers
+        incremental (bool): only process files that are new or changed since they were last loaded
+    """
+
+    # get all files matching extension from directory, leaving out files already loaded
+    all_files, fingerprints = find_files(cur, conn, filepath, incremental)
+
+    # get total number of files found
+    num_files = len(all_files)
+
+    workers = workers or os.cpu_count()
+    queue_depth = queue_depth or 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(all_files)
+        pending = deque(executor.submit(transform, f) for f in itertools.islice(remaining, queue_depth))
+
+        # write batches in file order, topping the queue back up as each one is taken
+        for i, datafile in enumerate(all_files, 1):
+            with source_file(datafile):
+                # read and transform run in the workers, the writer only sees how long it waits
+                with stage('wait'):
+                    batch = pending.popleft().result()
+                for f in itertools.islice(remaining, 1):
+                    pending.append(executor.submit(transform, f))
+
+                load(cur, batch)
+                if fingerprints is not None:
+                    record_file(cur, fingerprints[datafile])
+                with stage('commit'):
+                    conn.commit()
+            print('{}/{} files processed.'.format(i, num_files))
+
+
+def process_data_staged(cur, conn, filepath, truncate_query, copy_query, queries, batch_files=1000, incremental=False, before_insert=None):
+    """
+    - ELT load of the files found in the directory: the raw json records are COPYed into an
+      UNLOGGED staging table batch_files at a time, then the star schema tables are filled
+      from it with set-based sql, songplays matched to songs with a single join
+    - The whole directory is loaded in one transaction
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+        filepath (str): filepath for the directory
+        truncate_query (str): query emptying the staging table
+        copy_query (str): `COPY ... FROM STDIN` query of the staging table
+        queries (list): staged insert queries filling the star schema tables
+        batch_files (int): number of files sent in each COPY
+        incremental (bool): only process files that are new or changed since they were last loaded
+        before_insert (python function): optional, called with the cursor once the files are staged
+            and before the inserts run (e.g. to create songplays partitions)
+    """
+
+    # get all files matching extension from directory, leaving out files already loaded
+    all_files, fingerprints = find_files(cur, conn, filepath, incremental)
+
+    # get total number of files found
+    num_files = len(all_files)
+
+    start = time.perf_counter()
+    cur.execute(truncate_query)
+
+    records = 0
+    for i in range(0, num_files, batch_files):
+        batch_paths = all_files[i:i + batch_files]
+        with source_file(batch_paths):
+            records += copy_files(cur, copy_query, batch_paths)
+        print('{}/{} files staged.'.format(i + len(batch_paths), num_files))
+
+    if before_insert is not None:
+        before_insert(cur)
+    rows = run_staged_inserts(cur, queries)
+    if fingerprints is not None:
+        for datafile in all_files:
+            record_file(cur, fingerprints[datafile])
+    with stage('commit'):
+        conn.commit()
+    print('{} records staged, {} rows written'.format(records, rows))
+
+    elapsed = time.perf_counter() - start
+    if elapsed > 0:
+        print('{:.0f} files/sec, {:.0f} rows/sec'.format(num_files / elapsed, rows / elapsed))
+
+
+def add_constraints(cur, conn):
+    """
+    - Builds the secondary indexes and adds and validates the foreign keys in one pass once
+      everything is loaded, for tables created with `create_tables.py --bulk-load`
+    - Prints the orphan rows of every foreign key that does not hold instead of failing
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        conn (psycopg2.connect()): connection to the database
+    Returns:
+        dict of constraint name to list of (orphan value, rows)
+    """
+    with stage('constraints'):
+        create_indexes(cur, conn)
+        violations = create_foreign_keys(cur, conn)
+
+    for name, orphans in violations.items():
+        rows = sum(n for value, n in orphans)
+        count('foreign_key_violations', rows)
+        print('{} violated: {} rows reference {} missing keys, e.g. {}'.format(
+            name, rows, len(orphans), ', '.join(value for value, n in orphans[:5])))
+    if not violations:
+        print('foreign keys validated')
+
+    return violations
+
+
 def main():
     """
     - Function used to extract and transform the song_data and log_data to load into postgresql database        
     Usage:
-        python etl.py
+        python etl.py [--mode {row,bulk,staging}] [--song-index] [--index-size N] [--workers N] [--queue-depth N] [--song-batch N] [--log-batch N] [--incremental] [--create-indexes] [--add-constraints] [--report PATH] [--profile PATH] [--config PATH]
     """
 
-    conn = psycopg2.connect("host=127.0.0.1 dbname=sparkifydb user=student password=student")
+    parser = argparse.ArgumentParser(description='Load song_data and log_data into sparkifydb')
+    parser.add_argument('--mode', choices=['row', 'bulk', 'staging'], default='row',
+                        help='row inserts records one statement at a time, bulk sends each table as one batch per group of files, '
+                             'staging COPYs the raw json into staging tables and transforms it in sql')
+    parser.add_argument('--song-index', action='store_true',
+                        help='bulk mode only, match songplays against an in-memory song index instead of one query per event')
+    parser.add_argument('--index-size', type=int, default=500000,
+                        help='maximum number of songs held in the song index')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='bulk mode only, number of processes parsing files in parallel (0 processes files serially)')
+    parser.add_argument('--queue-depth', type=int, default=None,
+                        help='maximum number of parsed files waiting for the writer, defaults to twice the workers')
+    parser.add_argument('--song-batch', type=int, default=1000,
+                        help='bulk mode without workers, number of song files coalesced into each bulk write (staging mode, into each COPY)')
+    parser.add_argument('--log-batch', type=int, default=10,
+                        help='bulk mode without workers, number of log files coalesced into each bulk write (staging mode, into each COPY)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip files recorded in the load manifest whose contents have not changed')
+    parser.add_argument('--create-indexes', action='store_true',
+                        help='build the secondary indexes once song_data is loaded, for tables created with --defer-indexes')
+    parser.add_argument('--add-constraints', action='store_true',
+                        help='build the secondary indexes and add and validate the foreign keys after the load, for tables created with --bulk-load')
+    parser.add_argument('--report', default=None,
+                        help='write per-stage timings and row, conflict, round trip and unmatched songplay counters to this json file')
+    parser.add_argument('--profile', default=None,
+                        help='write cProfile stats of the run to this file')
+    parser.add_argument('--config', default=db.CONFIG_FILE,
+                        help='config file with the POSTGRES and BULK_SESSION settings')
+    args = parser.parse_args()
+
+    if args.mode != 'bulk' and args.workers:
+        parser.error('--workers requires --mode bulk')
+
+    report = instrumentation.start_report() if args.report else None
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    config = db.load_config(args.config)
+    conn = db.connect(config)
+    db.prepare_statements(conn)
+    if args.mode in ('bulk', 'staging'):
+        db.apply_session_settings(conn, config['BULK_SESSION'])
     cur = conn.cursor()
 
-    process_data(cur, conn, filepath='data/song_data/', func=process_song_file)
-    process_data(cur, conn, filepath='data/log_data/', func=process_log_file)
+    if args.workers:
+        process_data_parallel(cur, conn, 'data/song_data/', transform_song_file, load_song_batch, args.workers, args.queue_depth, args.incremental)
+    elif args.mode == 'bulk':
+        process_data_coalesced(cur, conn, 'data/song_data/', transform_song_files, load_song_batch, args.song_batch, args.incremental)
+    elif args.mode == 'staging':
+        process_data_staged(cur, conn, 'data/song_data/', staging_songs_table_truncate, staging_songs_copy, staged_song_queries, args.song_batch, args.incremental)
+    else:
+        process_data(cur, conn, filepath='data/song_data/', func=process_song_file, incremental=args.incremental)
+
+    # songs and artists are fully loaded here, so their indexes are built in one pass
+    # before the log stage starts probing them
+    if args.create_indexes:
+        create_indexes(cur, conn)
+
+    song_index = None
+    if args.mode == 'bulk' and args.song_index:
+        song_index = SongIndex(max_entries=args.index_size)
+        song_index.refresh(cur)
+
+    time_dimension = None
+    if args.mode == 'bulk':
+        time_dimension = TimeDimension()
+        time_dimension.refresh(cur)
+
+    # songplays partitions, when create_tables.py --partition-songplays made it partitioned
+    partitions = SongplayPartitions()
+    partitions.refresh(cur)
+
+    load = functools.partial(load_log_batch, song_index=song_index, time_dimension=time_dimension, partitions=partitions)
+    if args.workers:
+        process_data_parallel(cur, conn, 'data/log_data/', transform_log_file, load, args.workers, args.queue_depth, args.incremental)
+    elif args.mode == 'bulk':
+        process_data_coalesced(cur, conn, 'data/log_data/', transform_log_files, load, args.log_batch, args.incremental)
+    elif args.mode == 'staging':
+        process_data_staged(cur, conn, 'data/log_data/', staging_events_table_truncate, staging_events_copy, staged_log_queries, args.log_batch, args.incremental,
+                            before_insert=partitions.ensure_for_staging)
+    else:
+        process_data(cur, conn, filepath='data/log_data/', func=functools.partial(process_log_file, partitions=partitions), incremental=args.incremental)
+
+    if partitions.created:
+        print('songplays partitions created: {}'.format(', '.join(partitions.created)))
+
+    # the constraints are checked once against the loaded tables instead of on every insert
+    if args.add_constraints:
+        add_constraints(cur, conn)
+
+    if song_index is not None:
+        print('song index: {}'.format(song_index.stats()))
+    if time_dimension is not None:
+        print('time dimension: {} timestamps inserted, {} repeats skipped'.format(time_dimension.inserted, time_dimension.skipped))
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    if report is not None:
+        report.counters['round_trips'] = conn.round_trips
+        if song_index is not None:
+            report.counters.update({'song_index_' + k: v for k, v in song_index.stats().items()})
+        instrumentation.stop_report()
+        instrumentation.write_json(report, args.report)
+        print('run report written to {}'.format(args.report))
 
     conn.close()
 
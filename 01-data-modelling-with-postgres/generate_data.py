@@ -0,0 +1,213 @@
+import os
+import json
+import random
+import string
+import argparse
+from datetime import datetime, timedelta
+
+FIRST_NAMES = ['Walter', 'Kaylee', 'Lily', 'Jacob', 'Aleena', 'Jayden', 'Chloe', 'Tegan', 'Ryan', 'Mohammad', 'Kate', 'Sara']
+LAST_NAMES = ['Frye', 'Summers', 'Koch', 'Klein', 'Kirby', 'Graves', 'Cuevas', 'Levine', 'Smith', 'Rodriguez', 'Harrell', 'Johnson']
+LOCATIONS = ['San Francisco-Oakland-Hayward, CA', 'Phoenix-Mesa-Scottsdale, AZ', 'Waterloo-Cedar Falls, IA',
+             'Chicago-Naperville-Elgin, IL-IN-WI', 'New York-Newark-Jersey City, NY-NJ-PA', 'Lansing-East Lansing, MI']
+USER_AGENTS = [
+    '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36"',
+    '"Mozilla/5.0 (Windows NT 6.1; WOW64; rv:31.0) Gecko/20100101 Firefox/31.0"',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/36.0.1985.125 Chrome/36.0.1985.125 Safari/537.36',
+]
+OTHER_PAGES = ['Home', 'Logout', 'Settings', 'Help', 'About']
+
+
+def random_id(rng, prefix, length=16):
+    """
+    Returns:
+        identifier shaped like the million song dataset ids, e.g. SOMZWCG12A8C13C480
+    """
+    return prefix + ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(length))
+
+
+def generate_songs(rng, num_songs, num_artists):
+    """
+    - Builds a catalog of song records in the song_data layout
+    Args:
+        rng (random.Random): seeded random generator
+        num_songs (int): number of songs
+        num_artists (int): number of distinct artists the songs are spread over
+    Returns:
+        list of song record dicts
+    """
+    artists = []
+    for i in range(num_artists):
+        has_location = rng.random() < 0.5
+        artists.append({
+            'artist_id': random_id(rng, 'AR'),
+            'artist_latitude': round(rng.uniform(-60, 60), 5) if has_location else None,
+            'artist_longitude': round(rng.uniform(-150, 150), 5) if has_location else None,
+            'artist_location': rng.choice(LOCATIONS) if has_location else '',
+            'artist_name': 'Artist {}'.format(i),
+        })
+
+    songs = []
+    for i in range(num_songs):
+        artist = rng.choice(artists)
+        song = {'num_songs': 1}
+        song.update(artist)
+        song.update({
+            'song_id': random_id(rng, 'SO'),
+            'title': 'Song {}'.format(i),
+            'duration': round(rng.uniform(90, 480), 5),
+            'year': rng.choice([0, rng.randint(1960, 2018)]),
+        })
+        songs.append(song)
+
+    return songs
+
+
+def write_song_files(songs, output_dir):
+    """
+    - Writes one song per file under song_data/<A>/<B>/<C>/ like the sample data
+    Args:
+        songs (list): song records from `generate_songs`
+        output_dir (str): root directory of the generated data
+    """
+    for song in songs:
+        track_id = 'TR' + song['song_id'][2:]
+        directory = os.path.join(output_dir, 'song_data', track_id[2], track_id[3], track_id[4])
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, track_id + '.json'), 'w', encoding='utf8') as f:
+            f.write(json.dumps(song))
+
+
+def generate_events(rng, songs, day, num_events, num_users, match_ratio):
+    """
+    - Builds one day of app events in the log_data layout
+    - About 80% of events are NextSong plays, match_ratio of those play a song from the
+      catalog so the songplay lookup finds it, the rest play songs unknown to the catalog
+    Args:
+        rng (random.Random): seeded random generator
+        songs (list): song records from `generate_songs`
+        day (datetime): day the events happen on
+        num_events (int): number of events in the file
+        num_users (int): number of distinct users
+        match_ratio (float): share of NextSong events that match a catalog song
+    Returns:
+        list of event dicts
+    """
+    start_ms = int((day - datetime(1970, 1, 1)).total_seconds() * 1000)
+    timestamps = sorted(start_ms + rng.randrange(86400000) for _ in range(num_events))
+
+    events = []
+    for item, ts in enumerate(timestamps):
+        user_id = rng.randint(1, num_users)
+        user = {
+            'firstName': FIRST_NAMES[user_id % len(FIRST_NAMES)],
+            'gender': 'F' if user_id % 2 else 'M',
+            'lastName': LAST_NAMES[user_id % len(LAST_NAMES)],
+            'level': rng.choice(['free', 'paid']),
+            'location': LOCATIONS[user_id % len(LOCATIONS)],
+            'registration': 1540000000000.0 + user_id * 1000,
+            'userAgent': USER_AGENTS[user_id % len(USER_AGENTS)],
+            'userId': str(user_id),
+        }
+
+        if rng.random() < 0.8:
+            if songs and rng.random() < match_ratio:
+                song = rng.choice(songs)
+                artist, title, length = song['artist_name'], song['title'], song['duration']
+            else:
+                artist, title, length = 'Unknown Artist {}'.format(rng.randrange(10000)), 'Unknown Song {}'.format(rng.randrange(100000)), round(rng.uniform(90, 480), 5)
+            page, method = 'NextSong', 'PUT'
+        else:
+            artist, title, length = None, None, None
+            page, method = rng.choice(OTHER_PAGES), 'GET'
+
+        events.append({
+            'artist': artist,
+            'auth': 'Logged In',
+            'firstName': user['firstName'],
+            'gender': user['gender'],
+            'itemInSession': item % 100,
+            'lastName': user['lastName'],
+            'length': length,
+            'level': user['level'],
+            'location': user['location'],
+            'method': method,
+            'page': page,
+            'registration': user['registration'],
+            'sessionId': (user_id * 1000 + item // 100) % 2147483647,
+            'song': title,
+            'status': 200,
+            'ts': ts,
+            'userAgent': user['userAgent'],
+            'userId': user['userId'],
+        })
+
+    return events
+
+
+def write_log_file(events, day, output_dir):
+    """
+    - Writes a day of events as json lines under log_data/<year>/<month>/ like the sample data
+    Args:
+        events (list): event dicts from `generate_events`
+        day (datetime): day the events happen on
+        output_dir (str): root directory of the generated data
+    """
+    directory = os.path.join(output_dir, 'log_data', day.strftime('%Y'), day.strftime('%m'))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, day.strftime('%Y-%m-%d-events.json')), 'w', encoding='utf8') as f:
+        for event in events:
+            f.write(json.dumps(event, separators=(',', ':')) + '\n')
+
+
+def generate(output_dir, song_files=1000, log_files=30, events_per_file=1000, match_ratio=0.5,
+             num_artists=None, num_users=100, start_date='2018-11-01', seed=42):
+    """
+    - Generates song_data and log_data with the same file layout and json format as the sample data
+    Args:
+        output_dir (str): root directory of the generated data
+        song_files (int): number of song files, one song each
+        log_files (int): number of log files, one day each
+        events_per_file (int): number of events in each log file
+        match_ratio (float): share of NextSong events that match a catalog song
+        num_artists (int): number of artists, defaults to a third of the songs
+        num_users (int): number of distinct users
+        start_date (str): day of the first log file (YYYY-MM-DD)
+        seed (int): seed for reproducible output
+    """
+    rng = random.Random(seed)
+
+    songs = generate_songs(rng, song_files, num_artists or max(1, song_files // 3))
+    write_song_files(songs, output_dir)
+    print('{} song files written to {}'.format(len(songs), os.path.join(output_dir, 'song_data')))
+
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    for i in range(log_files):
+        write_log_file(generate_events(rng, songs, day, events_per_file, num_users, match_ratio), day, output_dir)
+        day += timedelta(days=1)
+    print('{} log files written to {}'.format(log_files, os.path.join(output_dir, 'log_data')))
+
+
+def main():
+    """
+    - Generates synthetic Sparkify data at a configurable scale
+    Usage:
+        python generate_data.py [--output DIR] [--song-files N] [--log-files N] [--events-per-file N] [--match-ratio F]
+    """
+    parser = argparse.ArgumentParser(description='Generate synthetic song_data and log_data')
+    parser.add_argument('--output', default='data/synthetic', help='directory the song_data and log_data folders are written to')
+    parser.add_argument('--song-files', type=int, default=1000, help='number of song files, one song each')
+    parser.add_argument('--log-files', type=int, default=30, help='number of log files, one day each')
+    parser.add_argument('--events-per-file', type=int, default=1000, help='number of events in each log file')
+    parser.add_argument('--match-ratio', type=float, default=0.5, help='share of NextSong events that match a generated song')
+    parser.add_argument('--artists', type=int, default=None, help='number of artists, defaults to a third of the songs')
+    parser.add_argument('--users', type=int, default=100, help='number of distinct users')
+    parser.add_argument('--start-date', default='2018-11-01', help='day of the first log file (YYYY-MM-DD)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    args = parser.parse_args()
+
+    generate(args.output, args.song_files, args.log_files, args.events_per_file, args.match_ratio,
+             args.artists, args.users, args.start_date, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_report = None
+
+
+class RunReport:
+    """
+    - Collects stage timings and counters for one ETL run
+    - Stages are timed overall and per file, counters are kept per table
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'calls': 0})
+        self.tables = defaultdict(lambda: {'attempted': 0, 'written': 0, 'conflicts_skipped': 0, 'statements': 0})
+        self.counters = defaultdict(int)
+        self.files = []
+        self.current_file = None
+
+    def add_stage(self, name, seconds):
+        stage = self.stages[name]
+        stage['seconds'] += seconds
+        stage['calls'] += 1
+        if self.current_file is not None:
+            stages = self.current_file['stages']
+            stages[name] = stages.get(name, 0.0) + seconds
+
+    def to_dict(self):
+        """
+        Returns:
+            the report as plain dicts and lists, ready for json
+        """
+        return {
+            'started': self.started,
+            'seconds': time.time() - self.started,
+            'stages': {name: dict(stage) for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])},
+            'tables': {name: dict(table) for name, table in self.tables.items()},
+            'counters': dict(self.counters),
+            'files': self.files,
+        }
+
+
+def start_report():
+    """
+    - Starts collecting a report, the hooks below are no-ops until this is called
+    Returns:
+        the active RunReport
+    """
+    global _report
+    _report = RunReport()
+
+    return _report
+
+
+def stop_report():
+    """
+    - Stops collecting and returns the report that was active
+    """
+    global _report
+    report, _report = _report, None
+
+    return report
+
+
+@contextmanager
+def stage(name):
+    """
+    - Times the block as the named stage (e.g. read, transform, lookup, write.songs)
+    """
+    if _report is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _report.add_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def source_file(filepaths):
+    """
+    - Attributes the stages timed within the block to the input file, or batch of files, it loads
+    """
+    if _report is None:
+        yield
+        return
+
+    entry = {'files': filepaths if isinstance(filepaths, list) else [filepaths], 'seconds': 0.0, 'stages': {}}
+    _report.current_file = entry
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry['seconds'] = time.perf_counter() - start
+        _report.current_file = None
+        _report.files.append(entry)
+
+
+def record_write(table, attempted, written, statements=1):
+    """
+    - Counts rows sent to a table, the rows the database reported as written and the
+      difference, which ON CONFLICT DO NOTHING skipped
+    Args:
+        table (str): table name
+        attempted (int): rows sent
+        written (int): rows inserted or updated according to the cursor's rowcount
+        statements (int): statements used to send them
+    """
+    if _report is None:
+        return
+
+    counts = _report.tables[table]
+    counts['attempted'] += attempted
+    counts['written'] += written
+    counts['conflicts_skipped'] += attempted - written
+    counts['statements'] += statements
+
+
+def count(name, n=1):
+    """
+    - Adds n to a named counter (e.g. unmatched_songplays)
+    """
+    if _report is not None:
+        _report.counters[name] += n
+
+
+def write_json(report, path):
+    """
+    - Writes the report to a json file
+    """
+    with open(path, 'w') as f:
+        json.dump(report.to_dict(), f, indent=2, default=str)
@@ -0,0 +1,133 @@
+import os
+import hashlib
+from sql_queries import load_manifest_select, load_manifest_upsert
+
+
+class AppendedFile(str):
+    """
+    - Filepath of a file that grew since it was loaded, `offset` is the number of bytes
+      already loaded so only what was appended after them is read
+    """
+
+    def __new__(cls, filepath, offset):
+        path = super().__new__(cls, filepath)
+        path.offset = offset
+        return path
+
+    def __reduce__(self):
+        # keeps the offset when the path is sent to the worker processes
+        return AppendedFile, (str(self), self.offset)
+
+
+def read_text(filepath):
+    """
+    - Reads the file, or only the part appended since it was loaded for an `AppendedFile`
+    Args:
+        filepath (str): filepath for the file
+    Returns:
+        the text read
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(getattr(filepath, 'offset', 0))
+        return f.read().decode('utf8')
+
+
+def file_hash(filepath, chunk_size=1 << 20, limit=None):
+    """
+    - Computes the sha256 of the file contents, reading it in chunks
+    Args:
+        filepath (str): filepath for the file
+        chunk_size (int): number of bytes read at a time
+        limit (int): optional, only hash the first limit bytes
+    Returns:
+        hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    remaining = float('inf') if limit is None else limit
+    with open(filepath, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(int(min(chunk_size, remaining)))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest()
+
+
+def load_manifest(cur, filepath):
+    """
+    - Reads the manifest entries of every file already loaded from the directory
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        filepath (str): filepath for the directory
+    Returns:
+        dict of path to (size, mtime, content_hash)
+    """
+    prefix = os.path.abspath(filepath).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    cur.execute(load_manifest_select, (prefix + '%',))
+
+    return {path: (size, mtime, content_hash) for path, size, mtime, content_hash in cur}
+
+
+def select_new_files(cur, all_files, filepath):
+    """
+    - Compares each file with its manifest entry and keeps only new or grown files
+    - Files with the same size and mtime are skipped without being read
+    - Files whose size or mtime changed are hashed, if the contents are unchanged the
+      manifest entry is refreshed and the file is skipped
+    - A file whose first bytes still hash to the recorded contents was appended to, it is
+      returned as an `AppendedFile` so only the new lines are loaded, and skipped when
+      they are blank
+    - Any other change would load the file's records a second time next to the ones
+      already loaded, such files are refused and left for the tables to be rebuilt
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        all_files (list): filepaths found in the directory
+        filepath (str): filepath for the directory
+    Returns:
+        list of files to load, dict of file to its (path, size, mtime, content_hash)
+        manifest row, list of skipped files and list of refused files
+    """
+    manifest = load_manifest(cur, filepath)
+
+    new_files, fingerprints, skipped, refused = [], {}, [], []
+    for f in all_files:
+        stat = os.stat(f)
+        entry = manifest.get(f)
+
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            skipped.append(f)
+            continue
+
+        content_hash = file_hash(f)
+        fingerprint = (f, stat.st_size, stat.st_mtime, content_hash)
+        if entry and entry[2] == content_hash:
+            record_file(cur, fingerprint)
+            skipped.append(f)
+            continue
+
+        if entry:
+            if stat.st_size < entry[0] or file_hash(f, limit=entry[0]) != entry[2]:
+                refused.append(f)
+                continue
+            f = AppendedFile(f, entry[0])
+            if not read_text(f).strip():
+                record_file(cur, fingerprint)
+                skipped.append(f)
+                continue
+
+        new_files.append(f)
+        fingerprints[f] = fingerprint
+
+    return new_files, fingerprints, skipped, refused
+
+
+def record_file(cur, fingerprint):
+    """
+    - Marks a file as loaded, should run in the same transaction as the file's data
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        fingerprint (tuple): (path, size, mtime, content_hash) of the file
+    """
+    cur.execute(load_manifest_upsert, fingerprint)
@@ -0,0 +1,190 @@
+import re
+import argparse
+import numpy as np
+from psycopg2 import sql
+import db
+from sql_queries import (songplay_partition_create, songplay_partition_attach, songplay_partition_detach, songplay_partition_drop,
+                         songplay_partitioned_select, songplay_partitions_select, table_exists_select, staging_events_months_select,
+                         rollup_days_delete, rollup_deltas_upsert)
+
+
+def partition_name(month):
+    """
+    Returns:
+        name of the songplays partition holding the month (YYYY-MM), e.g. songplays_2018_11
+    """
+    return 'songplays_' + month.replace('-', '_')
+
+
+def month_bounds(month):
+    """
+    Returns:
+        first day of the month (YYYY-MM) and first day of the next month, as timestamps
+    """
+    year, number = map(int, month.split('-'))
+    next_year, next_number = (year + 1, 1) if number == 12 else (year, number + 1)
+
+    return '{:04d}-{:02d}-01 00:00:00'.format(year, number), '{:04d}-{:02d}-01 00:00:00'.format(next_year, next_number)
+
+
+def list_partitions(cur):
+    """
+    Returns:
+        months (YYYY-MM) of the partitions attached to songplays, oldest first
+    """
+    cur.execute(songplay_partitions_select)
+
+    return [m.group(1) + '-' + m.group(2) for m in (re.match(r'songplays_(\d{4})_(\d{2})$', name) for name, in cur) if m]
+
+
+def attach_partition(cur, conn, month):
+    """
+    - Attaches a detached songplays_YYYY_MM table back to songplays as the month's partition
+    - Postgres scans its rows once to check they all fall within the month
+    - The month's plays are added back to the rollups in the same transaction
+    """
+    start, end = month_bounds(month)
+    partition = sql.Identifier(partition_name(month))
+    cur.execute(sql.SQL(songplay_partition_attach).format(partition=partition, start=sql.Literal(start), end=sql.Literal(end)))
+    cur.execute(sql.SQL(rollup_deltas_upsert).format(source=partition))
+    conn.commit()
+
+
+def remove_rollup_days(cur, month):
+    """
+    - Deletes the month's days from the rollups, in the transaction taking its partition out
+    """
+    start, end = month_bounds(month)
+    cur.execute(rollup_days_delete, {'start': start, 'end': end})
+
+
+def detach_partition(cur, conn, month):
+    """
+    - Detaches the month from songplays, its rows stay in a standalone songplays_YYYY_MM table
+    - Only the catalog changes, so it takes the same time whatever the size of the partition
+    - The month's days leave the rollups in the same transaction
+    """
+    cur.execute(sql.SQL(songplay_partition_detach).format(partition=sql.Identifier(partition_name(month))))
+    remove_rollup_days(cur, month)
+    conn.commit()
+
+
+def drop_partition(cur, conn, month):
+    """
+    - Drops the month's partition and its rows, attached or detached, without scanning it
+    - The month's days leave the rollups in the same transaction
+    """
+    cur.execute(sql.SQL(songplay_partition_drop).format(partition=sql.Identifier(partition_name(month))))
+    remove_rollup_days(cur, month)
+    conn.commit()
+
+
+class SongplayPartitions:
+    """
+    - Creates the monthly songplays partitions a batch needs before its songplays are inserted
+    - Partitions already attached are cached so the catalog is read once per run
+    - Does nothing when songplays was created as a plain table
+    """
+
+    def __init__(self):
+        self.partitioned = False
+        self.known = set()
+        self.created = []
+
+    def refresh(self, cur):
+        """
+        - Reads whether songplays is partitioned and which months it already has
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+        """
+        cur.execute(songplay_partitioned_select)
+        self.partitioned = cur.fetchone()[0]
+        self.known = set(list_partitions(cur)) if self.partitioned else set()
+
+    def ensure(self, cur, months):
+        """
+        - Creates the partitions of any months not attached yet, in the current transaction
+        - Raises ValueError for a month detached with `partitions.py --detach`, as its table
+          still holds the month's rows; it has to be attached again or dropped before the
+          month is loaded
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+            months (iterable): months as YYYY-MM strings
+        """
+        if not self.partitioned:
+            return
+
+        for month in sorted(set(months) - self.known):
+            cur.execute(table_exists_select, (partition_name(month),))
+            if cur.fetchone()[0]:
+                raise ValueError('songplays for {} cannot be loaded: {} was detached and still exists, attach it again with '
+                                 '`python partitions.py --attach {}` or drop it with `python partitions.py --drop {}`'
+                                 .format(month, partition_name(month), month, month))
+
+            start, end = month_bounds(month)
+            cur.execute(sql.SQL(songplay_partition_create).format(
+                partition=sql.Identifier(partition_name(month)), start=sql.Literal(start), end=sql.Literal(end)))
+            self.known.add(month)
+            self.created.append(month)
+
+    def ensure_for_timestamps(self, cur, ts):
+        """
+        - Creates the partitions covering event timestamps
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+            ts (array-like): event timestamps in epoch milliseconds
+        """
+        if not self.partitioned or len(ts) == 0:
+            return
+
+        months = np.unique(np.asarray(ts, dtype='int64').astype('datetime64[ms]').astype('datetime64[M]'))
+        self.ensure(cur, (str(month) for month in months))
+
+    def ensure_for_staging(self, cur):
+        """
+        - Creates the partitions covering the NextSong events in staging_events
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+        """
+        if not self.partitioned:
+            return
+
+        cur.execute(staging_events_months_select)
+        self.ensure(cur, [month for month, in cur.fetchall()])
+
+
+def main():
+    """
+    - Lists, detaches or drops monthly songplays partitions
+    Usage:
+        python partitions.py [--attach YYYY-MM ...] [--detach YYYY-MM ...] [--drop YYYY-MM ...] [--config PATH]
+    """
+    parser = argparse.ArgumentParser(description='Manage the monthly songplays partitions')
+    parser.add_argument('--attach', nargs='+', default=[], metavar='YYYY-MM',
+                        help='attach detached months back to songplays')
+    parser.add_argument('--detach', nargs='+', default=[], metavar='YYYY-MM',
+                        help='detach the months from songplays, keeping their rows as standalone tables')
+    parser.add_argument('--drop', nargs='+', default=[], metavar='YYYY-MM',
+                        help='drop the months and their rows')
+    parser.add_argument('--config', default=db.CONFIG_FILE, help='config file with the POSTGRES settings')
+    args = parser.parse_args()
+
+    conn = db.connect(db.load_config(args.config))
+    cur = conn.cursor()
+
+    for month in args.attach:
+        attach_partition(cur, conn, month)
+        print('{} attached'.format(partition_name(month)))
+    for month in args.detach:
+        detach_partition(cur, conn, month)
+        print('{} detached'.format(partition_name(month)))
+    for month in args.drop:
+        drop_partition(cur, conn, month)
+        print('{} dropped'.format(partition_name(month)))
+
+    print('songplays partitions: {}'.format(', '.join(list_partitions(cur)) or 'none'))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
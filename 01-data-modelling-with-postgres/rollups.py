@@ -0,0 +1,111 @@
+import argparse
+import db
+from sql_queries import (plays_per_day_select, plays_per_level_select, top_users_select, top_songs_select, top_artists_select,
+                         rollup_tables_truncate, rollup_rebuild)
+
+
+def plays_per_day(cur, start=None, end=None):
+    """
+    Returns:
+        list of (day, plays) between the start and end days (inclusive, None for open ended)
+    """
+    cur.execute(plays_per_day_select, {'start': start, 'end': end})
+
+    return cur.fetchall()
+
+
+def plays_per_level(cur, start=None, end=None):
+    """
+    Returns:
+        list of (level, plays) between the start and end days, most played first
+    """
+    cur.execute(plays_per_level_select, {'start': start, 'end': end})
+
+    return cur.fetchall()
+
+
+def top_users(cur, start=None, end=None, limit=10):
+    """
+    Returns:
+        list of (user_id, first_name, last_name, plays) of the users with the most plays
+    """
+    cur.execute(top_users_select, {'start': start, 'end': end, 'limit': limit})
+
+    return cur.fetchall()
+
+
+def top_songs(cur, start=None, end=None, limit=10):
+    """
+    Returns:
+        list of (song_id, title, plays) of the most played songs
+    """
+    cur.execute(top_songs_select, {'start': start, 'end': end, 'limit': limit})
+
+    return cur.fetchall()
+
+
+def top_artists(cur, start=None, end=None, limit=10):
+    """
+    Returns:
+        list of (artist_id, name, plays) of the most played artists
+    """
+    cur.execute(top_artists_select, {'start': start, 'end': end, 'limit': limit})
+
+    return cur.fetchall()
+
+
+def rebuild_rollups(cur, conn):
+    """
+    - Recomputes the rollups from songplays in one transaction, needed only when songplays
+      changes other than by insert or through partitions.py (e.g. rows deleted by hand)
+    """
+    cur.execute(rollup_tables_truncate)
+    cur.execute(rollup_rebuild)
+    conn.commit()
+
+
+def main():
+    """
+    - Prints the dashboard aggregates from the rollup tables instead of scanning songplays
+    Usage:
+        python rollups.py [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--limit N] [--rebuild] [--config PATH]
+    """
+    parser = argparse.ArgumentParser(description='Query the songplays rollups')
+    parser.add_argument('--start', default=None, help='first day included (YYYY-MM-DD)')
+    parser.add_argument('--end', default=None, help='last day included (YYYY-MM-DD)')
+    parser.add_argument('--limit', type=int, default=10, help='number of top users, songs and artists')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from songplays first')
+    parser.add_argument('--config', default=db.CONFIG_FILE, help='config file with the POSTGRES settings')
+    args = parser.parse_args()
+
+    conn = db.connect(db.load_config(args.config))
+    cur = conn.cursor()
+
+    if args.rebuild:
+        rebuild_rollups(cur, conn)
+
+    print('plays per day')
+    for day, plays in plays_per_day(cur, args.start, args.end):
+        print('  {}  {}'.format(day, plays))
+
+    print('plays per level')
+    for level, plays in plays_per_level(cur, args.start, args.end):
+        print('  {}  {}'.format(level, plays))
+
+    print('top users')
+    for user_id, first_name, last_name, plays in top_users(cur, args.start, args.end, args.limit):
+        print('  {} {} {}  {}'.format(user_id, first_name, last_name, plays))
+
+    print('top songs')
+    for song_id, title, plays in top_songs(cur, args.start, args.end, args.limit):
+        print('  {} {}  {}'.format(song_id, title, plays))
+
+    print('top artists')
+    for artist_id, name, plays in top_artists(cur, args.start, args.end, args.limit):
+        print('  {} {}  {}'.format(artist_id, name, plays))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
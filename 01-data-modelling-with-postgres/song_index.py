@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from sql_queries import song_select, song_lookup_select
+
+
+class SongIndex:
+    """
+    - In-memory lookup of (song title, artist name, duration) to (song_id, artist_id)
+    - Replaces the per-event `song_select` query when loading songplays
+    - Holds at most max_entries keys, least recently used keys are evicted first
+    - When the catalog does not fit the index is partial and misses fall back to
+      `song_select` on the cursor passed to `lookup`; keys the database does not have
+      either are remembered, up to max_misses, so most log events, which match no song,
+      are not looked up again
+    Args:
+        max_entries (int): maximum number of keys held in memory
+        max_misses (int): maximum number of keys remembered as not in the catalog
+    """
+
+    def __init__(self, max_entries=500000, max_misses=100000):
+        self.max_entries = max_entries
+        self.max_misses = max_misses
+        self.entries = OrderedDict()
+        self.missing = OrderedDict()
+        self.complete = True
+        self.hits = 0
+        self.misses = 0
+        self.db_lookups = 0
+
+    def _add(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.complete = False
+
+    def refresh(self, cur):
+        """
+        - Rebuilds the index from the songs and artists tables
+        - Should be called after song_data has been loaded so new songs can be matched
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+        """
+        self.entries.clear()
+        self.missing.clear()
+        self.complete = True
+        cur.execute(song_lookup_select)
+        for title, name, duration, song_id, artist_id in cur:
+            self._add((title, name, duration), (song_id, artist_id))
+
+    def lookup(self, title, artist, duration, cur=None):
+        """
+        - Finds the song_id and artist_id for a played song
+        Args:
+            title (str): song title from the log event
+            artist (str): artist name from the log event
+            duration (float): song length from the log event
+            cur (psycopg2.cursor()): optional cursor used when the index is partial
+        Returns:
+            (song_id, artist_id) tuple, (None, None) when the song is not in the catalog
+        """
+        key = (title, artist, duration)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+        if not self.complete and cur is not None and key not in self.missing:
+            self.db_lookups += 1
+            cur.execute(song_select, key)
+            row = cur.fetchone()
+            if row:
+                self.hits += 1
+                self._add(key, tuple(row))
+                return tuple(row)
+
+            self.missing[key] = None
+            if len(self.missing) > self.max_misses:
+                self.missing.popitem(last=False)
+        elif key in self.missing:
+            self.missing.move_to_end(key)
+
+        self.misses += 1
+        return None, None
+
+    def stats(self):
+        """
+        Returns:
+            dict with entry and remembered miss counts, hits, misses, database fallbacks and hit ratio
+        """
+        total = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'missing': len(self.missing),
+            'complete': self.complete,
+            'hits': self.hits,
+            'misses': self.misses,
+            'db_lookups': self.db_lookups,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
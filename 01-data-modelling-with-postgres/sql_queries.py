@@ -5,24 +5,54 @@ user_table_drop = "DROP TABLE IF EXISTS users"
 song_table_drop = "DROP TABLE IF EXISTS songs"
 artist_table_drop = "DROP TABLE IF EXISTS artists"
 time_table_drop = "DROP TABLE IF EXISTS time"
+load_manifest_table_drop = "DROP TABLE IF EXISTS load_manifest"
+song_match_key_functions_drop = "DROP FUNCTION IF EXISTS song_match_key, songs_set_match_key, artists_fill_match_key"
+daily_user_plays_table_drop = "DROP TABLE IF EXISTS daily_user_plays"
+daily_song_plays_table_drop = "DROP TABLE IF EXISTS daily_song_plays"
+daily_artist_plays_table_drop = "DROP TABLE IF EXISTS daily_artist_plays"
+daily_level_plays_table_drop = "DROP TABLE IF EXISTS daily_level_plays"
+rollup_functions_drop = "DROP FUNCTION IF EXISTS songplays_update_rollups"
+staging_events_table_drop = "DROP TABLE IF EXISTS staging_events"
+staging_songs_table_drop = "DROP TABLE IF EXISTS staging_songs"
 
 # CREATE TABLES
+# foreign keys are added separately (see FOREIGN KEYS) so a bulk load can add them after the data
 
 songplay_table_create = ("""
     CREATE TABLE IF NOT EXISTS songplays
     (
         songplay_id SERIAL PRIMARY KEY,
-        start_time TIMESTAMP REFERENCES time(start_time),
-        user_id INT NOT NULL REFERENCES users(user_id),
+        start_time TIMESTAMP,
+        user_id INT NOT NULL,
         level TEXT,
-        song_id TEXT REFERENCES songs(song_id),
-        artist_id TEXT REFERENCES artists(artists_id),
+        song_id TEXT,
+        artist_id TEXT,
         session_id INT,
         location TEXT,
         user_agent TEXT
     )
 """)
 
+# songplays range partitioned by month on start_time, the primary key has to include the
+# partition key; partitions are created by the loader as months arrive (see partitions.py)
+
+songplay_partitioned_table_create = ("""
+    CREATE TABLE IF NOT EXISTS songplays
+    (
+        songplay_id SERIAL,
+        start_time TIMESTAMP NOT NULL,
+        user_id INT NOT NULL,
+        level TEXT,
+        song_id TEXT,
+        artist_id TEXT,
+        session_id INT,
+        location TEXT,
+        user_agent TEXT,
+        PRIMARY KEY (songplay_id, start_time)
+    )
+    PARTITION BY RANGE (start_time)
+""")
+
 user_table_create = ("""
     CREATE TABLE IF NOT EXISTS users
     (
@@ -41,7 +71,8 @@ song_table_create = ("""
         title TEXT NOT NULL,
         artist_id TEXT NOT NULL,
         year INT,
-        duration FLOAT NOT NULL
+        duration FLOAT NOT NULL,
+        match_key TEXT
     )
 """)
 
@@ -69,13 +100,261 @@ time_table_create = ("""
     )
 """)
 
+load_manifest_table_create = ("""
+    CREATE TABLE IF NOT EXISTS load_manifest
+    (
+        path TEXT PRIMARY KEY,
+        size BIGINT NOT NULL,
+        mtime FLOAT NOT NULL,
+        content_hash TEXT NOT NULL,
+        loaded_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+""")
+
+# ROLLUP TABLES
+# daily play counts kept in step with songplays by the songplays_rollups trigger
+
+daily_user_plays_table_create = ("""
+    CREATE TABLE IF NOT EXISTS daily_user_plays
+    (
+        day DATE,
+        user_id INT,
+        plays BIGINT NOT NULL,
+        PRIMARY KEY (day, user_id)
+    )
+""")
+
+daily_song_plays_table_create = ("""
+    CREATE TABLE IF NOT EXISTS daily_song_plays
+    (
+        day DATE,
+        song_id TEXT,
+        plays BIGINT NOT NULL,
+        PRIMARY KEY (day, song_id)
+    )
+""")
+
+daily_artist_plays_table_create = ("""
+    CREATE TABLE IF NOT EXISTS daily_artist_plays
+    (
+        day DATE,
+        artist_id TEXT,
+        plays BIGINT NOT NULL,
+        PRIMARY KEY (day, artist_id)
+    )
+""")
+
+daily_level_plays_table_create = ("""
+    CREATE TABLE IF NOT EXISTS daily_level_plays
+    (
+        day DATE,
+        level TEXT,
+        plays BIGINT NOT NULL,
+        PRIMARY KEY (day, level)
+    )
+""")
+
+# STAGING TABLES
+# UNLOGGED tables holding each raw json record as COPY received it, staging_id keeps file order
+
+staging_events_table_create = ("""
+    CREATE UNLOGGED TABLE IF NOT EXISTS staging_events
+    (
+        staging_id BIGSERIAL,
+        event JSONB NOT NULL
+    )
+""")
+
+staging_songs_table_create = ("""
+    CREATE UNLOGGED TABLE IF NOT EXISTS staging_songs
+    (
+        staging_id BIGSERIAL,
+        song JSONB NOT NULL
+    )
+""")
+
+# SONGPLAY PARTITIONS
+# composed with psycopg2.sql so partition names are quoted as identifiers
+
+songplay_partition_create = ("""
+    CREATE TABLE {partition} PARTITION OF songplays
+    FOR VALUES FROM ({start}) TO ({end})
+""")
+
+songplay_partition_attach = ("""
+    ALTER TABLE songplays ATTACH PARTITION {partition}
+    FOR VALUES FROM ({start}) TO ({end})
+""")
+
+songplay_partition_detach = "ALTER TABLE songplays DETACH PARTITION {partition}"
+songplay_partition_drop = "DROP TABLE IF EXISTS {partition}"
+
+# block range index, a few pages per partition, created on the parent so every partition gets one
+songplay_start_time_brin_index_create = "CREATE INDEX IF NOT EXISTS songplays_start_time_brin_idx ON songplays USING BRIN (start_time)"
+
+# SONG MATCH KEY
+# songs.match_key holds a hash of title|artist name|duration so songplays are matched
+# with one index probe; it is filled on insert of the song when its artist is already
+# loaded (the loaders insert artists first), else on insert of the artist
+
+song_match_key_function_create = ("""
+    CREATE OR REPLACE FUNCTION song_match_key(title TEXT, artist_name TEXT, duration FLOAT)
+    RETURNS TEXT AS $$
+        SELECT md5(title || '|' || artist_name || '|' || duration::TEXT)
+    $$ LANGUAGE SQL IMMUTABLE
+""")
+
+song_match_key_trigger_create = ("""
+    CREATE OR REPLACE FUNCTION songs_set_match_key() RETURNS TRIGGER AS $$
+    BEGIN
+        SELECT song_match_key(NEW.title, a.name, NEW.duration) INTO NEW.match_key
+        FROM artists a
+        WHERE a.artists_id = NEW.artist_id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER songs_match_key
+    BEFORE INSERT ON songs
+    FOR EACH ROW EXECUTE PROCEDURE songs_set_match_key();
+""")
+
+artist_match_key_trigger_create = ("""
+    CREATE OR REPLACE FUNCTION artists_fill_match_key() RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE songs s
+        SET match_key = song_match_key(s.title, n.name, s.duration)
+        FROM new_artists n
+        WHERE s.artist_id = n.artists_id
+        AND s.match_key IS NULL;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER artists_match_key
+    AFTER INSERT ON artists
+    REFERENCING NEW TABLE AS new_artists
+    FOR EACH STATEMENT EXECUTE PROCEDURE artists_fill_match_key();
+""")
+
+# the songs still waiting for their artist, nearly always none, so the artists trigger probes
+# a near empty index rather than scanning songs; created with the tables in every mode
+song_pending_match_key_index_create = "CREATE INDEX IF NOT EXISTS songs_pending_match_key_idx ON songs (artist_id) WHERE match_key IS NULL"
+
+# ROLLUP MAINTENANCE
+# each insert statement on songplays adds the play counts of the rows it inserted, so every
+# load mode upserts only its own deltas; row mode inserts one songplay per statement, so it
+# turns the trigger off for its transaction and adds the deltas of each file at once
+
+rollup_deltas_upsert = ("""
+    INSERT INTO daily_user_plays (day, user_id, plays)
+    SELECT start_time::DATE, user_id, COUNT(*)
+    FROM {source}
+    GROUP BY 1, 2
+    ON CONFLICT (day, user_id) DO UPDATE SET plays = daily_user_plays.plays + EXCLUDED.plays;
+
+    INSERT INTO daily_song_plays (day, song_id, plays)
+    SELECT start_time::DATE, song_id, COUNT(*)
+    FROM {source}
+    WHERE song_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, song_id) DO UPDATE SET plays = daily_song_plays.plays + EXCLUDED.plays;
+
+    INSERT INTO daily_artist_plays (day, artist_id, plays)
+    SELECT start_time::DATE, artist_id, COUNT(*)
+    FROM {source}
+    WHERE artist_id IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, artist_id) DO UPDATE SET plays = daily_artist_plays.plays + EXCLUDED.plays;
+
+    INSERT INTO daily_level_plays (day, level, plays)
+    SELECT start_time::DATE, level, COUNT(*)
+    FROM {source}
+    WHERE level IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, level) DO UPDATE SET plays = daily_level_plays.plays + EXCLUDED.plays;
+""")
+
+songplay_rollups_trigger_create = ("""
+    CREATE OR REPLACE FUNCTION songplays_update_rollups() RETURNS TRIGGER AS $$
+    BEGIN
+        IF current_setting('sparkify.defer_rollups', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+    """ + rollup_deltas_upsert.format(source='new_songplays') + """
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER songplays_rollups
+    AFTER INSERT ON songplays
+    REFERENCING NEW TABLE AS new_songplays
+    FOR EACH STATEMENT EXECUTE PROCEDURE songplays_update_rollups();
+""")
+
+rollups_defer_set = "SET LOCAL sparkify.defer_rollups TO on"
+songplay_max_id_select = "SELECT COALESCE(MAX(songplay_id), 0) FROM songplays"
+# the deltas of the songplays inserted after a songplay_id, by the single loader writing them
+rollup_deltas_after_upsert = rollup_deltas_upsert.format(source='(SELECT * FROM songplays WHERE songplay_id > %(after)s) AS new_songplays')
+
+# removes the days of a songplays partition being detached or dropped, it holds every play of them
+rollup_days_delete = ("""
+    DELETE FROM daily_user_plays WHERE day >= %(start)s::DATE AND day < %(end)s::DATE;
+    DELETE FROM daily_song_plays WHERE day >= %(start)s::DATE AND day < %(end)s::DATE;
+    DELETE FROM daily_artist_plays WHERE day >= %(start)s::DATE AND day < %(end)s::DATE;
+    DELETE FROM daily_level_plays WHERE day >= %(start)s::DATE AND day < %(end)s::DATE;
+""")
+
+# recomputes the rollups from songplays, e.g. after they were changed other than by insert
+rollup_tables_truncate = "TRUNCATE daily_user_plays, daily_song_plays, daily_artist_plays, daily_level_plays"
+rollup_rebuild = rollup_deltas_upsert.format(source='songplays')
+
+# CREATE INDEXES
+# secondary indexes supporting song_select, created with the tables or after a bulk load
+
+song_match_key_index_create = "CREATE INDEX IF NOT EXISTS songs_match_key_idx ON songs (match_key)"
+song_artist_index_create = "CREATE INDEX IF NOT EXISTS songs_artist_id_idx ON songs (artist_id)"
+song_title_duration_index_create = "CREATE INDEX IF NOT EXISTS songs_title_duration_idx ON songs (title, duration)"
+artist_name_index_create = "CREATE INDEX IF NOT EXISTS artists_name_idx ON artists (name)"
+
+# FOREIGN KEYS
+# formatted with an entry of `foreign_keys`; a key whose existing rows have orphans is added
+# NOT VALID, so it holds for new rows, and validated once they are fixed
+
+foreign_key_create = ("""
+    ALTER TABLE {table}
+    ADD CONSTRAINT {name}
+    FOREIGN KEY ({column}) REFERENCES {ref_table} ({ref_column})
+""")
+
+foreign_key_create_not_valid = foreign_key_create + " NOT VALID"
+
+foreign_key_validate = "ALTER TABLE {table} VALIDATE CONSTRAINT {name}"
+
+foreign_key_violations_select = ("""
+    SELECT c.{column}::TEXT, COUNT(*)
+    FROM {table} c
+    WHERE c.{column} IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM {ref_table} p WHERE p.{ref_column} = c.{column})
+    GROUP BY c.{column}
+    ORDER BY COUNT(*) DESC;
+""")
+
+foreign_key_select = ("""
+    SELECT convalidated
+    FROM pg_constraint
+    WHERE conname = %s
+    AND conrelid = to_regclass(%s);
+""")
+
 # INSERT RECORDS
+# songplay inserts name no conflict target so they also work on the partitioned table
 
 songplay_table_insert = ("""
     INSERT INTO songplays
     (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (songplay_id) DO NOTHING;
+    ON CONFLICT DO NOTHING;
 """)
 
 user_table_insert = ("""
@@ -106,19 +385,301 @@ time_table_insert = ("""
     ON CONFLICT (start_time) DO NOTHING;
 """)
 
+load_manifest_upsert = ("""
+    INSERT INTO load_manifest
+    (path, size, mtime, content_hash)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (path) DO UPDATE SET
+        size = EXCLUDED.size,
+        mtime = EXCLUDED.mtime,
+        content_hash = EXCLUDED.content_hash,
+        loaded_at = now();
+""")
+
+# BULK INSERT RECORDS
+# multi-row VALUES variants of the inserts above for psycopg2.extras.execute_values,
+# each keeps the same ON CONFLICT behaviour as its single-row counterpart
+
+songplay_table_bulk_insert = ("""
+    INSERT INTO songplays
+    (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+    VALUES %s
+    ON CONFLICT DO NOTHING;
+""")
+
+user_table_bulk_insert = ("""
+    INSERT INTO users
+    (user_id, first_name, last_name, gender, level)
+    VALUES %s
+    ON CONFLICT (user_id) DO UPDATE SET level = EXCLUDED.level;
+""")
+
+song_table_bulk_insert = ("""
+    INSERT INTO songs
+    (song_id, title, artist_id, year, duration)
+    VALUES %s
+    ON CONFLICT (song_id) DO NOTHING;
+""")
+
+artist_table_bulk_insert = ("""
+    INSERT INTO artists
+    (artists_id, name, location, latitude, longitude)
+    VALUES %s
+    ON CONFLICT (artists_id) DO NOTHING;
+""")
+
+time_table_bulk_insert = ("""
+    INSERT INTO time
+    (start_time, hour, day, week, month, year, weekday)
+    VALUES %s
+    ON CONFLICT (start_time) DO NOTHING;
+""")
+
+# STAGING COPY
+# one json record per line, csv with control characters as quote and delimiter so the
+# json text reaches the jsonb input unchanged (text format would eat its backslashes)
+
+staging_events_copy = "COPY staging_events (event) FROM STDIN WITH (FORMAT csv, DELIMITER E'\\x1f', QUOTE E'\\x1e')"
+staging_songs_copy = "COPY staging_songs (song) FROM STDIN WITH (FORMAT csv, DELIMITER E'\\x1f', QUOTE E'\\x1e')"
+
+staging_events_table_truncate = "TRUNCATE staging_events"
+staging_songs_table_truncate = "TRUNCATE staging_songs"
+
+# STAGED INSERT RECORDS
+# set-based transforms from the staging tables, repeated keys resolve as they do when
+# files are loaded one row at a time: first song and artist wins, last user level wins
+
+staged_artist_table_insert = ("""
+    INSERT INTO artists
+    (artists_id, name, location, latitude, longitude)
+    SELECT DISTINCT ON (song->>'artist_id')
+        song->>'artist_id',
+        song->>'artist_name',
+        song->>'artist_location',
+        (song->>'artist_latitude')::FLOAT,
+        (song->>'artist_longitude')::FLOAT
+    FROM staging_songs
+    ORDER BY song->>'artist_id', staging_id
+    ON CONFLICT (artists_id) DO NOTHING;
+""")
+
+staged_song_table_insert = ("""
+    INSERT INTO songs
+    (song_id, title, artist_id, year, duration)
+    SELECT DISTINCT ON (song->>'song_id')
+        song->>'song_id',
+        song->>'title',
+        song->>'artist_id',
+        (song->>'year')::INT,
+        (song->>'duration')::FLOAT
+    FROM staging_songs
+    ORDER BY song->>'song_id', staging_id
+    ON CONFLICT (song_id) DO NOTHING;
+""")
+
+staged_time_table_insert = ("""
+    INSERT INTO time
+    (start_time, hour, day, week, month, year, weekday)
+    SELECT
+        t.start_time,
+        EXTRACT(HOUR FROM t.start_time)::INT,
+        EXTRACT(DAY FROM t.start_time)::INT,
+        EXTRACT(WEEK FROM t.start_time)::INT,
+        EXTRACT(MONTH FROM t.start_time)::INT,
+        EXTRACT(YEAR FROM t.start_time)::INT,
+        (EXTRACT(ISODOW FROM t.start_time)::INT - 1)::TEXT
+    FROM (
+        SELECT DISTINCT TIMESTAMP 'epoch' + (event->>'ts')::BIGINT * INTERVAL '1 millisecond' AS start_time
+        FROM staging_events
+        WHERE event->>'page' = 'NextSong'
+    ) t
+    ON CONFLICT (start_time) DO NOTHING;
+""")
+
+staged_user_table_insert = ("""
+    INSERT INTO users
+    (user_id, first_name, last_name, gender, level)
+    SELECT DISTINCT ON ((event->>'userId')::INT)
+        (event->>'userId')::INT,
+        event->>'firstName',
+        event->>'lastName',
+        event->>'gender',
+        event->>'level'
+    FROM staging_events
+    WHERE event->>'page' = 'NextSong'
+    ORDER BY (event->>'userId')::INT, staging_id DESC
+    ON CONFLICT (user_id) DO UPDATE SET level = EXCLUDED.level;
+""")
+
+staged_songplay_table_insert = ("""
+    INSERT INTO songplays
+    (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+    SELECT
+        TIMESTAMP 'epoch' + (e.event->>'ts')::BIGINT * INTERVAL '1 millisecond',
+        (e.event->>'userId')::INT,
+        e.event->>'level',
+        s.song_id,
+        s.artist_id,
+        (e.event->>'sessionId')::INT,
+        e.event->>'location',
+        e.event->>'userAgent'
+    FROM staging_events e
+    LEFT JOIN (
+        SELECT DISTINCT ON (match_key) match_key, song_id, artist_id
+        FROM songs
+        WHERE match_key IS NOT NULL
+        ORDER BY match_key, song_id
+    ) s
+    ON s.match_key = song_match_key(e.event->>'song', e.event->>'artist', (e.event->>'length')::FLOAT)
+    WHERE e.event->>'page' = 'NextSong'
+    ORDER BY e.staging_id
+    ON CONFLICT DO NOTHING;
+""")
+
 # FIND SONGS
 
 song_select = ("""
-    SELECT s.song_id, a.artists_id
+    SELECT s.song_id, s.artist_id
+    FROM songs s
+    WHERE s.match_key = song_match_key(%s, %s, %s);
+""")
+
+song_lookup_select = ("""
+    SELECT s.title, a.name, s.duration, s.song_id, a.artists_id
     FROM songs s
     INNER JOIN artists a
-    ON s.artist_id = a.artists_id
-    WHERE s.title = %s 
-    AND a.name = %s 
-    AND s.duration = %s;
+    ON s.artist_id = a.artists_id;
+""")
+
+# FIND SONGPLAY PARTITIONS
+
+songplay_partitioned_select = ("""
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table
+        WHERE partrelid = to_regclass('songplays')
+    );
+""")
+
+songplay_partitions_select = ("""
+    SELECT c.relname
+    FROM pg_inherits i
+    INNER JOIN pg_class c
+    ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('songplays')
+    ORDER BY c.relname;
+""")
+
+# a partition name taken by a table that is not attached, e.g. a detached month
+table_exists_select = "SELECT to_regclass(%s) IS NOT NULL;"
+
+staging_events_months_select = ("""
+    SELECT DISTINCT to_char(TIMESTAMP 'epoch' + (event->>'ts')::BIGINT * INTERVAL '1 millisecond', 'YYYY-MM')
+    FROM staging_events
+    WHERE event->>'page' = 'NextSong';
+""")
+
+# ROLLUP QUERIES
+# dashboard aggregates read from the rollups, start and end days are inclusive, NULL for open ended
+
+plays_per_day_select = ("""
+    SELECT day, SUM(plays)
+    FROM daily_user_plays
+    WHERE (%(start)s::DATE IS NULL OR day >= %(start)s::DATE)
+    AND (%(end)s::DATE IS NULL OR day <= %(end)s::DATE)
+    GROUP BY day
+    ORDER BY day;
+""")
+
+plays_per_level_select = ("""
+    SELECT level, SUM(plays)
+    FROM daily_level_plays
+    WHERE (%(start)s::DATE IS NULL OR day >= %(start)s::DATE)
+    AND (%(end)s::DATE IS NULL OR day <= %(end)s::DATE)
+    GROUP BY level
+    ORDER BY SUM(plays) DESC;
+""")
+
+top_users_select = ("""
+    SELECT r.user_id, u.first_name, u.last_name, SUM(r.plays)
+    FROM daily_user_plays r
+    LEFT JOIN users u
+    ON u.user_id = r.user_id
+    WHERE (%(start)s::DATE IS NULL OR r.day >= %(start)s::DATE)
+    AND (%(end)s::DATE IS NULL OR r.day <= %(end)s::DATE)
+    GROUP BY r.user_id, u.first_name, u.last_name
+    ORDER BY SUM(r.plays) DESC, r.user_id
+    LIMIT %(limit)s;
+""")
+
+top_songs_select = ("""
+    SELECT r.song_id, s.title, SUM(r.plays)
+    FROM daily_song_plays r
+    LEFT JOIN songs s
+    ON s.song_id = r.song_id
+    WHERE (%(start)s::DATE IS NULL OR r.day >= %(start)s::DATE)
+    AND (%(end)s::DATE IS NULL OR r.day <= %(end)s::DATE)
+    GROUP BY r.song_id, s.title
+    ORDER BY SUM(r.plays) DESC, r.song_id
+    LIMIT %(limit)s;
+""")
+
+top_artists_select = ("""
+    SELECT r.artist_id, a.name, SUM(r.plays)
+    FROM daily_artist_plays r
+    LEFT JOIN artists a
+    ON a.artists_id = r.artist_id
+    WHERE (%(start)s::DATE IS NULL OR r.day >= %(start)s::DATE)
+    AND (%(end)s::DATE IS NULL OR r.day <= %(end)s::DATE)
+    GROUP BY r.artist_id, a.name
+    ORDER BY SUM(r.plays) DESC, r.artist_id
+    LIMIT %(limit)s;
+""")
+
+# FIND LOADED TIMESTAMPS
+
+time_keys_select = ("""
+    SELECT (EXTRACT(EPOCH FROM start_time) * 1000)::BIGINT
+    FROM time;
+""")
+
+# FIND LOADED FILES
+
+load_manifest_select = ("""
+    SELECT path, size, mtime, content_hash
+    FROM load_manifest
+    WHERE path LIKE %s;
 """)
 
 # QUERY LISTS
 
-create_table_queries = [user_table_create, song_table_create, artist_table_create, time_table_create, songplay_table_create]
-drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
+create_table_queries = [user_table_create, song_table_create, artist_table_create, time_table_create, songplay_table_create, load_manifest_table_create,
+                        daily_user_plays_table_create, daily_song_plays_table_create, daily_artist_plays_table_create, daily_level_plays_table_create,
+                        staging_events_table_create, staging_songs_table_create, song_match_key_function_create, song_match_key_trigger_create, artist_match_key_trigger_create,
+                        song_pending_match_key_index_create, songplay_rollups_trigger_create]
+foreign_keys = [
+    # (table, constraint, column, referenced table, referenced column)
+    ('songplays', 'songplays_start_time_fkey', 'start_time', 'time', 'start_time'),
+    ('songplays', 'songplays_user_id_fkey', 'user_id', 'users', 'user_id'),
+    ('songplays', 'songplays_song_id_fkey', 'song_id', 'songs', 'song_id'),
+    ('songplays', 'songplays_artist_id_fkey', 'artist_id', 'artists', 'artists_id'),
+]
+create_index_queries = [song_match_key_index_create, song_artist_index_create, song_title_duration_index_create, artist_name_index_create]
+drop_table_queries = [songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop, load_manifest_table_drop,
+                      daily_user_plays_table_drop, daily_song_plays_table_drop, daily_artist_plays_table_drop, daily_level_plays_table_drop,
+                      staging_events_table_drop, staging_songs_table_drop, song_match_key_functions_drop, rollup_functions_drop]
+staged_song_queries = [staged_artist_table_insert, staged_song_table_insert]
+staged_log_queries = [staged_time_table_insert, staged_user_table_insert, staged_songplay_table_insert]
+
+# PREPARED STATEMENTS
+# single-row statements prepared once per connection by db.prepare_statements
+
+prepared_queries = {
+    'songplay_insert': songplay_table_insert,
+    'user_insert': user_table_insert,
+    'song_insert': song_table_insert,
+    'artist_insert': artist_table_insert,
+    'time_insert': time_table_insert,
+    'song_select': song_select,
+    'load_manifest_upsert': load_manifest_upsert,
+}
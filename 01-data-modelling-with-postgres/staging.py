@@ -0,0 +1,61 @@
+import io
+import re
+from instrumentation import stage, record_write, count
+from manifest import read_text
+
+
+def read_records(filepaths):
+    """
+    - Concatenates the json lines of many files, one record per line, blank lines left out
+    Args:
+        filepaths (list): filepaths for the files
+    Returns:
+        io.StringIO holding the records, and the number of records
+    """
+    with stage('read'):
+        lines = []
+        for filepath in filepaths:
+            lines.extend(line for line in read_text(filepath).splitlines() if line.strip())
+
+        return io.StringIO('\n'.join(lines) + '\n'), len(lines)
+
+
+def copy_files(cur, copy_query, filepaths):
+    """
+    - Streams the raw records of the files into a staging table with a single COPY
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        copy_query (str): `COPY ... FROM STDIN` query of the staging table
+        filepaths (list): filepaths for the files
+    Returns:
+        Number of records staged
+    """
+    table = re.search(r'COPY (\w+)', copy_query).group(1)
+
+    records, num_records = read_records(filepaths)
+    with stage('copy.' + table):
+        cur.copy_expert(copy_query, records)
+    count('staged.' + table, num_records)
+
+    return num_records
+
+
+def run_staged_inserts(cur, queries):
+    """
+    - Fills the star schema tables from the staging tables with set-based INSERT ... SELECT
+    Args:
+        cur (psycopg2.cursor()): cursor for the database
+        queries (list): staged insert queries, in the order they must run
+    Returns:
+        Number of rows inserted or updated
+    """
+    written = 0
+    for query in queries:
+        table = re.search(r'INSERT INTO (\w+)', query).group(1)
+        with stage('write.' + table):
+            cur.execute(query)
+        # the rows offered are not known without a second pass, so conflicts are not reported
+        record_write(table, cur.rowcount, cur.rowcount)
+        written += cur.rowcount
+
+    return written
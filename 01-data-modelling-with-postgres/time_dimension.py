@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from sql_queries import time_table_bulk_insert, time_keys_select
+
+
+def build_time_rows(ts):
+    """
+    - Computes every calendar attribute of the time table in one vectorized pass
+    Args:
+        ts (array-like): event timestamps in epoch milliseconds, expected to be unique
+    Returns:
+        list of (start_time, hour, day, week, month, year, weekday) tuples
+    """
+    t = pd.Series(pd.to_datetime(np.asarray(ts, dtype='int64'), unit='ms'))
+
+    time_data = pd.concat([t, t.dt.hour, t.dt.day, t.dt.isocalendar().week.astype(int), t.dt.month, t.dt.year, t.dt.weekday], axis=1)
+
+    return list(time_data.itertuples(index=False, name=None))
+
+
+class TimeDimension:
+    """
+    - Loads the time table for batches of events, sending only timestamps it has not seen
+    - Timestamps are de-duplicated within each batch and checked against a local cache of
+      keys already in the table, so ON CONFLICT is left with nothing to discard
+    """
+
+    def __init__(self):
+        self.known = set()
+        self.inserted = 0
+        self.skipped = 0
+
+    def refresh(self, cur):
+        """
+        - Fills the cache with the start_time keys already in the time table
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+        """
+        cur.execute(time_keys_select)
+        self.known = {ms for ms, in cur}
+
+    def load(self, cur, ts, page_size=1000):
+        """
+        - Inserts the time rows of timestamps not yet in the table
+        Args:
+            cur (psycopg2.cursor()): cursor for the database
+            ts (array-like): event timestamps in epoch milliseconds, repeats allowed
+            page_size (int): maximum number of rows per statement
+        Returns:
+            Number of rows inserted
+        """
+        ts = np.asarray(ts, dtype='int64')
+        unique = pd.unique(ts)
+        known = self.known
+        new = unique[np.fromiter((v not in known for v in unique.tolist()), dtype=bool, count=len(unique))]
+
+        self.skipped += len(ts) - len(new)
+        if len(new) == 0:
+            return 0
+
+        rows = build_time_rows(new)
+        for start in range(0, len(rows), page_size):
+            execute_values(cur, time_table_bulk_insert, rows[start:start + page_size], page_size=page_size)
+
+        known.update(new.tolist())
+        self.inserted += len(new)
+
+        return len(new)
@@ -0,0 +1,156 @@
+import os
+import csv
+import glob
+import argparse
+import itertools
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# columns of event_datafile_new.csv, in order
+COLUMNS = ['artist', 'firstName', 'gender', 'itemInSession', 'lastName', 'length',
+           'level', 'location', 'sessionId', 'song', 'userId']
+
+# one typed row of event_datafile_new.csv
+Event = namedtuple('Event', COLUMNS)
+
+csv.register_dialect('myDialect', quoting=csv.QUOTE_ALL, skipinitialspace=True)
+
+
+def get_files(filepath):
+    """
+    - Collects every csv file below the directory, sorted so the output order is stable
+    Args:
+        filepath (str): filepath for the directory
+    Returns:
+        list of filepaths
+    """
+    file_path_list = []
+    for root, dirs, files in os.walk(filepath):
+        file_path_list.extend(glob.glob(os.path.join(root, '*.csv')))
+
+    return sorted(file_path_list)
+
+
+def read_event_rows(filepath):
+    """
+    - Streams the rows of one event file, projected to `COLUMNS`
+    - Rows with an empty artist (events other than song plays) are dropped
+    Args:
+        filepath (str): filepath for the event csv file
+    Yields:
+        list of the projected values of each row
+    """
+    with open(filepath, 'r', encoding='utf8', newline='') as csvfile:
+        csvreader = csv.reader(csvfile)
+        header = next(csvreader, None)
+        if header is None:
+            return
+
+        # pick the columns by name so the projection does not depend on the file's column order
+        indexes = [header.index(column) for column in COLUMNS]
+        artist = indexes[0]
+        for line in csvreader:
+            if line[artist] == '':
+                continue
+            yield [line[i] for i in indexes]
+
+
+def read_event_file(filepath):
+    """
+    - Parses one event file in a worker process
+    Returns:
+        list of the projected rows of the file
+    """
+    return list(read_event_rows(filepath))
+
+
+def iter_event_rows(file_path_list, workers=0, queue_depth=None):
+    """
+    - Streams the projected rows of every file in file order
+    - With workers, files are parsed on a pool of processes, at most queue_depth files
+      ahead of the consumer, so memory is bounded by a few files whatever their number
+    Args:
+        file_path_list (list): filepaths for the event csv files
+        workers (int): number of worker processes, 0 parses the files in this process
+        queue_depth (int): maximum number of parsed files waiting, defaults to twice the workers
+    Yields:
+        list of the projected values of each row
+    """
+    if not workers:
+        for f in file_path_list:
+            yield from read_event_rows(f)
+        return
+
+    queue_depth = queue_depth or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(file_path_list)
+        pending = deque(executor.submit(read_event_file, f) for f in itertools.islice(remaining, queue_depth))
+
+        # hand out files in order, topping the queue back up as each one is taken
+        while pending:
+            rows = pending.popleft().result()
+            for f in itertools.islice(remaining, 1):
+                pending.append(executor.submit(read_event_file, f))
+            yield from rows
+
+
+def write_event_file(rows, output):
+    """
+    - Writes rows to the event data csv as they arrive, replacing the output only once complete
+    Args:
+        rows (iterable): projected rows from `iter_event_rows`
+        output (str): filepath of the csv written
+    Returns:
+        Number of rows written
+    """
+    num_rows = 0
+    tmp_output = output + '.tmp'
+    with open(tmp_output, 'w', encoding='utf8', newline='') as f:
+        writer = csv.writer(f, dialect='myDialect')
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+            num_rows += 1
+    os.replace(tmp_output, output)
+
+    return num_rows
+
+
+def consolidate(filepath='event_data', output='event_datafile_new.csv', workers=0, queue_depth=None):
+    """
+    - Merges the daily event files into the smaller event data csv used to load the Cassandra tables
+    Args:
+        filepath (str): directory of the event csv files
+        output (str): filepath of the csv written
+        workers (int): number of processes parsing files, 0 parses them in this process
+        queue_depth (int): maximum number of parsed files waiting to be written
+    Returns:
+        Number of rows written
+    """
+    file_path_list = get_files(filepath)
+    print('{} files found in {}'.format(len(file_path_list), filepath))
+
+    num_rows = write_event_file(iter_event_rows(file_path_list, workers, queue_depth), output)
+    print('{} rows written to {}'.format(num_rows, output))
+
+    return num_rows
+
+
+def main():
+    """
+    - Consolidates event_data into event_datafile_new.csv with constant memory
+    Usage:
+        python consolidate_events.py [--input DIR] [--output PATH] [--workers N] [--queue-depth N]
+    """
+    parser = argparse.ArgumentParser(description='Merge the daily event csv files into event_datafile_new.csv')
+    parser.add_argument('--input', default='event_data', help='directory of the daily event csv files')
+    parser.add_argument('--output', default='event_datafile_new.csv', help='csv file written')
+    parser.add_argument('--workers', type=int, default=0, help='number of processes parsing files in parallel (0 parses them serially)')
+    parser.add_argument('--queue-depth', type=int, default=None, help='maximum number of parsed files waiting to be written, defaults to twice the workers')
+    args = parser.parse_args()
+
+    consolidate(args.input, args.output, args.workers, args.queue_depth)
+
+
+if __name__ == "__main__":
+    main()
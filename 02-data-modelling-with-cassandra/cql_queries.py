@@ -0,0 +1,78 @@
+# KEYSPACE
+
+keyspace_create = ("""
+    CREATE KEYSPACE IF NOT EXISTS {keyspace}
+    WITH REPLICATION = {{'class': 'SimpleStrategy', 'replication_factor': {replication_factor}}}
+""")
+
+# DROP TABLES
+
+session_playlist_table_drop = "DROP TABLE IF EXISTS session_playlist"
+user_session_table_drop = "DROP TABLE IF EXISTS user_session"
+song_listeners_table_drop = "DROP TABLE IF EXISTS song_listeners"
+
+# CREATE TABLES
+
+# Query 1: artist, song title and song's length heard during sessionId = 338, and itemInSession = 4
+session_playlist_table_create = ("""
+    CREATE TABLE IF NOT EXISTS session_playlist
+    (sessionId int, itemInSession int, artist text, song text, length float,
+    PRIMARY KEY(sessionId, itemInSession))
+    WITH CLUSTERING ORDER BY (itemInSession ASC)
+""")
+
+# Query 2: artist, song (sorted by itemInSession) and user (first and last name) for userid = 10, sessionid = 182
+user_session_table_create = ("""
+    CREATE TABLE IF NOT EXISTS user_session
+    (userId int, sessionId int, artist text, song text, firstName text, lastName text, itemInSession int,
+    PRIMARY KEY((userId, sessionId), itemInSession))
+    WITH CLUSTERING ORDER BY (itemInSession ASC)
+""")
+
+# Query 3: every user name (first and last) who listened to the song 'All Hands Against His Own'
+song_listeners_table_create = ("""
+    CREATE TABLE IF NOT EXISTS song_listeners
+    (song text, firstName text, lastName text, userId int,
+    PRIMARY KEY(song, userId))
+""")
+
+# INSERT RECORDS
+# prepared once per session, ? placeholders
+
+session_playlist_insert = ("""
+    INSERT INTO session_playlist (sessionId, itemInSession, artist, song, length)
+    VALUES (?, ?, ?, ?, ?)
+""")
+
+user_session_insert = ("""
+    INSERT INTO user_session (userId, sessionId, artist, song, firstName, lastName, itemInSession)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+""")
+
+song_listeners_insert = ("""
+    INSERT INTO song_listeners (song, firstName, lastName, userId)
+    VALUES (?, ?, ?, ?)
+""")
+
+# SELECT RECORDS
+# one per query table, prepared once per session
+
+session_playlist_select = ("""
+    SELECT artist, song, length FROM session_playlist
+    WHERE sessionId = ? AND itemInSession = ?
+""")
+
+user_session_select = ("""
+    SELECT artist, song, firstName, lastName FROM user_session
+    WHERE userId = ? AND sessionId = ?
+""")
+
+song_listeners_select = ("""
+    SELECT firstName, lastName FROM song_listeners
+    WHERE song = ?
+""")
+
+# QUERY LISTS
+
+create_table_queries = [session_playlist_table_create, user_session_table_create, song_listeners_table_create]
+drop_table_queries = [session_playlist_table_drop, user_session_table_drop, song_listeners_table_drop]
@@ -0,0 +1,129 @@
+import os
+import json
+import argparse
+import numpy as np
+from consolidate_events import COLUMNS, Event, get_files, iter_event_rows
+
+CACHE_FILE = 'event_cache.npz'
+
+# dtypes of the typed columns, the others are kept as fixed width unicode
+INT_COLUMNS = ['itemInSession', 'sessionId', 'userId']
+FLOAT_COLUMNS = ['length']
+
+
+def source_signature(filepath, file_path_list):
+    """
+    - Identifies the state of the daily event files by their path, mtime and size, so the cache
+      can tell they changed without reading them
+    Args:
+        filepath (str): directory of the files, paths are taken relative to it
+        file_path_list (list): filepaths of the files
+    Returns:
+        str with the columns and the (path, mtime_ns, size) of each file
+    """
+    files = []
+    for f in file_path_list:
+        st = os.stat(f)
+        files.append([os.path.relpath(f, filepath), st.st_mtime_ns, st.st_size])
+
+    return json.dumps({'columns': COLUMNS, 'files': files})
+
+
+def build_columns(rows):
+    """
+    - Converts the projected rows to one typed NumPy array per column
+    Args:
+        rows (iterable): projected rows from `iter_event_rows`
+    Returns:
+        dict of column name to array
+    """
+    values = list(zip(*rows)) or [()] * len(COLUMNS)
+    columns = {}
+    for column, column_values in zip(COLUMNS, values):
+        array = np.array(column_values, dtype=str)
+        if column in INT_COLUMNS:
+            array = array.astype(np.int64)
+        elif column in FLOAT_COLUMNS:
+            array = array.astype(np.float64)
+        columns[column] = array
+
+    return columns
+
+
+def read_cache(cache_file, signature):
+    """
+    Returns:
+        dict of column name to array, None if the cache is missing or was built from other files
+    """
+    if not os.path.exists(cache_file):
+        return None
+
+    with np.load(cache_file) as data:
+        if data['signature'].item() != signature:
+            return None
+        return {column: data[column] for column in COLUMNS}
+
+
+def write_cache(cache_file, signature, columns):
+    """
+    - Saves the compressed columns and the signature of their source files, replacing the cache only once complete
+    """
+    tmp_file = cache_file + '.tmp.npz'
+    np.savez_compressed(tmp_file, signature=np.array(signature), **columns)
+    os.replace(tmp_file, cache_file)
+
+
+def load_cache(filepath='event_data', cache_file=CACHE_FILE, workers=0, rebuild=False):
+    """
+    - Returns the merged song play events of the daily event files as typed columns
+    - The columns are read from the cache while the files keep the same paths, mtimes and
+      sizes, and rebuilt from the files otherwise
+    Args:
+        filepath (str): directory of the daily event csv files
+        cache_file (str): filepath of the .npz cache
+        workers (int): number of processes parsing files on a rebuild, 0 parses them in this process
+        rebuild (bool): rebuild the cache even if it is up to date
+    Returns:
+        dict of column name to array, in event order
+    """
+    file_path_list = get_files(filepath)
+    signature = source_signature(filepath, file_path_list)
+
+    columns = None if rebuild else read_cache(cache_file, signature)
+    if columns is not None:
+        print('{} events read from {}'.format(len(columns[COLUMNS[0]]), cache_file))
+        return columns
+
+    columns = build_columns(iter_event_rows(file_path_list, workers))
+    write_cache(cache_file, signature, columns)
+    print('{} events from {} files cached in {}'.format(len(columns[COLUMNS[0]]), len(file_path_list), cache_file))
+
+    return columns
+
+
+def iter_events(columns):
+    """
+    - Streams the cached columns as the typed Events used by the loaders, no csv parsing or
+      string to number conversion involved
+    """
+    return map(Event._make, zip(*(columns[column].tolist() for column in COLUMNS)))
+
+
+def main():
+    """
+    - Builds or refreshes the columnar cache of the daily event files
+    Usage:
+        python event_cache.py [--input DIR] [--cache PATH] [--workers N] [--rebuild]
+    """
+    parser = argparse.ArgumentParser(description='Cache the merged event data as typed columns')
+    parser.add_argument('--input', default='event_data', help='directory of the daily event csv files')
+    parser.add_argument('--cache', default=CACHE_FILE, help='.npz cache file')
+    parser.add_argument('--workers', type=int, default=0, help='number of processes parsing files on a rebuild')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the cache even if it is up to date')
+    args = parser.parse_args()
+
+    load_cache(args.input, args.cache, args.workers, args.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import csv
+import time
+import argparse
+from collections import OrderedDict, deque
+from cassandra.cluster import Cluster
+from cassandra.concurrent import execute_concurrent
+from cassandra.query import BatchStatement, BatchType
+from cql_queries import *
+from consolidate_events import Event
+from event_cache import CACHE_FILE, load_cache, iter_events
+
+
+def parse_event(line):
+    """
+    - Converts an event_datafile_new.csv line to an Event with int and float columns typed
+    """
+    artist, firstName, gender, itemInSession, lastName, length, level, location, sessionId, song, userId = line
+    return Event(artist, firstName, gender, int(itemInSession), lastName, float(length), level, location, int(sessionId), song, int(userId))
+
+
+def session_playlist_values(event):
+    return (event.sessionId, event.itemInSession, event.artist, event.song, event.length)
+
+
+def user_session_values(event):
+    return (event.userId, event.sessionId, event.artist, event.song, event.firstName, event.lastName, event.itemInSession)
+
+
+def song_listeners_values(event):
+    return (event.song, event.firstName, event.lastName, event.userId)
+
+
+# table name, insert query, projection of an Event onto the insert's values and number of
+# leading values forming the partition key, a new query table only needs an entry here to be
+# loaded from the same single pass
+TABLES = [
+    ('session_playlist', session_playlist_insert, session_playlist_values, 1),
+    ('user_session', user_session_insert, user_session_values, 2),
+    ('song_listeners', song_listeners_insert, song_listeners_values, 1),
+]
+
+
+def connect(hosts, keyspace, replication_factor=1):
+    """
+    - Connects to the cluster, creating the keyspace if needed
+    Args:
+        hosts (list): contact points of the cluster
+        keyspace (str): keyspace holding the tables
+        replication_factor (int): replication factor used if the keyspace is created
+    Returns:
+        the cluster and a session set to the keyspace
+    """
+    cluster = Cluster(hosts)
+    session = cluster.connect()
+    session.execute(keyspace_create.format(keyspace=keyspace, replication_factor=replication_factor))
+    session.set_keyspace(keyspace)
+
+    return cluster, session
+
+
+def create_tables(session):
+    """
+    Creates each table using the queries in `create_table_queries` list.
+    """
+    for query in create_table_queries:
+        session.execute(query)
+
+
+def drop_tables(session):
+    """
+    Drops each table using the queries in `drop_table_queries` list.
+    """
+    for query in drop_table_queries:
+        session.execute(query)
+
+
+def read_events(file, stats=None, max_errors=5):
+    """
+    - Streams the event data csv as typed Events, converting every value once
+    - Lines that fail to convert are skipped, counted in stats['parse_failures'] and the
+      first few printed
+    Args:
+        file (str): filepath of event_datafile_new.csv
+        stats (dict): optional, receives the parse failure count
+        max_errors (int): number of errors printed
+    """
+    failures = 0
+    with open(file, encoding='utf8', newline='') as f:
+        csvreader = csv.reader(f)
+        next(csvreader)
+        for line in csvreader:
+            try:
+                yield parse_event(line)
+            except (ValueError, TypeError) as e:
+                failures += 1
+                if stats is not None:
+                    stats['parse_failures'] = failures
+                if failures <= max_errors:
+                    print('line {}: {}'.format(csvreader.line_num, e))
+
+
+def values_size(values):
+    """
+    - Estimates the serialized size in bytes of the values of one insert
+    """
+    return sum(len(v.encode('utf8')) if isinstance(v, str) else 8 for v in values)
+
+
+def partition_batches(rows, batch_size=50, batch_bytes=5120, buffered_rows=10000):
+    """
+    - Groups rows by table and partition key, so each group can be sent as one single-partition
+      batch, which the coordinator applies on the replicas of that partition without fanning out
+    - A group is closed once it holds batch_size rows or would exceed batch_bytes (Cassandra
+      warns on batches over 5 KB by default), so large partitions go as several batches and a
+      row too large for a batch ends up alone in its group
+    - At most buffered_rows rows are held, the oldest groups are flushed beyond that
+    Args:
+        rows (iterable): (table, prepared insert, values, partition key size) tuples
+        batch_size (int): maximum number of rows in a group
+        batch_bytes (int): maximum estimated size of the values in a group
+        buffered_rows (int): maximum number of rows held in open groups
+    Yields:
+        (table, prepared insert, list of values) groups
+    """
+    groups = OrderedDict()
+    buffered = 0
+    for table, statement, values, key_size in rows:
+        key = (table, values[:key_size])
+        size = values_size(values)
+
+        group = groups.get(key)
+        if group is not None and group[3] + size > batch_bytes:
+            del groups[key]
+            buffered -= len(group[2])
+            yield group[:3]
+            group = None
+        if group is None:
+            group = groups[key] = [table, statement, [], 0]
+
+        group[2].append(values)
+        group[3] += size
+        buffered += 1
+        if len(group[2]) >= batch_size:
+            del groups[key]
+            buffered -= len(group[2])
+            yield group[:3]
+
+        while buffered > buffered_rows:
+            key, group = groups.popitem(last=False)
+            buffered -= len(group[2])
+            yield group[:3]
+
+    for group in groups.values():
+        yield group[:3]
+
+
+def load_tables(session, events, tables=TABLES, concurrency=100, max_errors=5, batch_size=0, batch_bytes=5120):
+    """
+    - Fans each Event out to every table in one pass over the events, so the file is read
+      and converted once whatever the number of query tables
+    - The inserts of all tables share one window of up to `concurrency` requests in flight
+    - With a batch_size above 1, rows of the same partition are sent together as UNLOGGED
+      batches (see `partition_batches`), groups of a single row as individual statements
+    Args:
+        session (cassandra.cluster.Session): session set to the keyspace
+        events (iterable): Events from `read_events`
+        tables (list): (table, insert query, projection, partition key size) entries, defaults to `TABLES`
+        concurrency (int): maximum number of requests in flight
+        max_errors (int): number of errors printed per table
+        batch_size (int): maximum number of rows per batch, 0 sends every row on its own
+        batch_bytes (int): maximum estimated size of a batch
+    Returns:
+        list of dicts with the table, rows written, failures, seconds and rows/sec
+    """
+    prepared = [(table, session.prepare(query), project, key_size) for table, query, project, key_size in tables]
+    stats = {table: {'table': table, 'rows': 0, 'failures': 0} for table, query, project, key_size in tables}
+
+    # results come back in the order the requests were generated, so the table and number of
+    # rows of each result are the oldest ones queued here
+    sent = deque()
+
+    def rows():
+        for event in events:
+            for table, statement, project, key_size in prepared:
+                yield table, statement, project(event), key_size
+
+    def statements():
+        if batch_size <= 1:
+            for table, statement, values, key_size in rows():
+                sent.append((table, 1))
+                yield statement, values
+            return
+
+        for table, statement, group in partition_batches(rows(), batch_size, batch_bytes):
+            sent.append((table, len(group)))
+            if len(group) == 1:
+                yield statement, group[0]
+                continue
+            batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for values in group:
+                batch.add(statement, values)
+            yield batch, None
+
+    start = time.perf_counter()
+    results = execute_concurrent(session, statements(), concurrency=concurrency,
+                                 raise_on_first_error=False, results_generator=True)
+    for success, result in results:
+        table, num_rows = sent.popleft()
+        table_stats = stats[table]
+        if success:
+            table_stats['rows'] += num_rows
+        else:
+            table_stats['failures'] += num_rows
+            if table_stats['failures'] <= max_errors:
+                print('{}: {}'.format(table_stats['table'], result))
+    seconds = time.perf_counter() - start
+
+    for table_stats in stats.values():
+        table_stats['seconds'] = round(seconds, 3)
+        table_stats['rows_per_sec'] = round(table_stats['rows'] / seconds, 1) if seconds else None
+
+    return list(stats.values())
+
+
+def print_report(results):
+    """
+    - Prints the load results as a table
+    """
+    columns = ['table', 'rows', 'failures', 'seconds', 'rows_per_sec']
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print('  '.join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    """
+    - Creates the query tables and loads event_datafile_new.csv, or the columnar cache of the
+      daily event files, into all of them in one pass
+    Usage:
+        python load_tables.py [--file PATH | --from-cache [--input DIR] [--cache PATH]] [--hosts HOST ...]
+                              [--keyspace NAME] [--concurrency N] [--batch-size N] [--batch-bytes N] [--drop]
+    """
+    parser = argparse.ArgumentParser(description='Load event_datafile_new.csv into the Cassandra query tables')
+    parser.add_argument('--file', default='event_datafile_new.csv', help='event data csv written by consolidate_events.py')
+    parser.add_argument('--from-cache', action='store_true', help='load the typed columns of event_cache.py instead of parsing the csv')
+    parser.add_argument('--input', default='event_data', help='directory of the daily event csv files cached with --from-cache')
+    parser.add_argument('--cache', default=CACHE_FILE, help='.npz cache file used with --from-cache')
+    parser.add_argument('--hosts', nargs='+', default=['127.0.0.1'], help='contact points of the cluster')
+    parser.add_argument('--keyspace', default='sparkify', help='keyspace holding the tables')
+    parser.add_argument('--concurrency', type=int, default=100, help='maximum number of inserts in flight')
+    parser.add_argument('--batch-size', type=int, default=0, help='maximum number of rows per single-partition UNLOGGED batch (0 sends every row on its own)')
+    parser.add_argument('--batch-bytes', type=int, default=5120, help='maximum estimated size of a batch in bytes')
+    parser.add_argument('--drop', action='store_true', help='drop the tables before loading them')
+    args = parser.parse_args()
+
+    cluster, session = connect(args.hosts, args.keyspace)
+    if args.drop:
+        drop_tables(session)
+    create_tables(session)
+
+    parse_stats = {}
+    if args.from_cache:
+        events = iter_events(load_cache(args.input, args.cache))
+    else:
+        events = read_events(args.file, parse_stats)
+    results = load_tables(session, events, TABLES, args.concurrency,
+                          batch_size=args.batch_size, batch_bytes=args.batch_bytes)
+    print_report(results)
+    if parse_stats:
+        print('{} lines could not be parsed'.format(parse_stats['parse_failures']))
+
+    session.shutdown()
+    cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import re
+import time
+from collections import namedtuple
+
+create_table_pattern = re.compile(r'CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*)PRIMARY KEY\s*\((.*)\)\s*\)', re.S | re.I)
+drop_table_pattern = re.compile(r'DROP TABLE IF EXISTS (\w+)', re.I)
+insert_pattern = re.compile(r'INSERT INTO (\w+)\s*\(([^)]*)\)\s*VALUES', re.S | re.I)
+select_pattern = re.compile(r'SELECT (.*) FROM (\w+)\s+WHERE (.*)', re.S | re.I)
+
+
+def names(text):
+    """
+    - Splits a comma separated list of CQL identifiers, lower cased as Cassandra does
+    """
+    return [name.strip().lower() for name in text.split(',') if name.strip()]
+
+
+class LocalStatement:
+    """
+    - A statement parsed once by `LocalSession.prepare`, the stand-in for a PreparedStatement
+    """
+
+    def __init__(self, query):
+        self.query_string = query
+        self.kind, self.table, self.args = self.parse(query)
+
+    @staticmethod
+    def parse(query):
+        query = query.strip()
+        match = create_table_pattern.match(query)
+        if match:
+            table, columns, key = match.groups()
+            key = key.strip()
+            if key.startswith('('):
+                partition, clustering = key[1:].split(')', 1)
+            else:
+                partition, clustering = key.split(',', 1) if ',' in key else (key, '')
+            columns = [column.split()[0] for column in names(columns)]
+            return 'create', table.lower(), (columns, names(partition), names(clustering))
+
+        match = drop_table_pattern.match(query)
+        if match:
+            return 'drop', match.group(1).lower(), None
+
+        match = insert_pattern.match(query)
+        if match:
+            return 'insert', match.group(1).lower(), names(match.group(2))
+
+        match = select_pattern.match(query)
+        if match:
+            columns, table, where = match.groups()
+            conditions = [condition.split('=')[0] for condition in re.split(r'\s+AND\s+', where.strip(), flags=re.I)]
+            selected = names(columns)
+            return 'select', table.lower(), (selected, names(','.join(conditions)), namedtuple('Row', selected))
+
+        if query.upper().startswith('CREATE KEYSPACE'):
+            return 'noop', None, None
+
+        raise ValueError('statement not supported by LocalSession: {}'.format(query))
+
+
+class LocalSession:
+    """
+    - In-process stand-in for a cassandra.cluster.Session, enough to create, load and query the
+      tables of cql_queries without a cluster, e.g. to benchmark the query paths
+    - Rows are kept per partition and returned in clustering order, selects must give the whole
+      partition key and optionally a prefix of the clustering columns, all with ? placeholders
+    - latency adds a sleep to every request to stand in for the network round trip
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.statements = {}
+
+    def prepare(self, query):
+        return LocalStatement(query)
+
+    def set_keyspace(self, keyspace):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def execute(self, statement, parameters=None):
+        if isinstance(statement, str):
+            if statement not in self.statements:
+                self.statements[statement] = LocalStatement(statement)
+            statement = self.statements[statement]
+        if self.latency:
+            time.sleep(self.latency)
+
+        kind, table, args = statement.kind, statement.table, statement.args
+        if kind == 'create':
+            self.tables.setdefault(table, (args, {}))
+        elif kind == 'drop':
+            self.tables.pop(table, None)
+        elif kind == 'insert':
+            (columns, partition, clustering), partitions = self.tables[table]
+            row = dict(zip(args, parameters))
+            rows = partitions.setdefault(tuple(row[c] for c in partition), {})
+            rows[tuple(row[c] for c in clustering)] = row
+        elif kind == 'select':
+            (columns, partition, clustering), partitions = self.tables[table]
+            selected, conditions, Row = args
+            values = dict(zip(conditions, parameters))
+            rows = partitions.get(tuple(values[c] for c in partition), {})
+            prefix = tuple(values[c] for c in clustering if c in values)
+            return [Row(*(rows[key][c] for c in selected)) for key in sorted(rows) if key[:len(prefix)] == prefix]
+
+        return []
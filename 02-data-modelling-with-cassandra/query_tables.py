@@ -0,0 +1,268 @@
+import time
+import random
+import argparse
+import statistics
+from collections import OrderedDict
+from cql_queries import *
+from load_tables import TABLES, connect, create_tables, load_tables, read_events
+from local_session import LocalSession
+
+# table name and the select answering its query
+QUERIES = OrderedDict([
+    ('session_playlist', session_playlist_select),
+    ('user_session', user_session_select),
+    ('song_listeners', song_listeners_select),
+])
+
+
+class ResultCache:
+    """
+    - LRU cache of query results, entries expire ttl seconds after they were stored
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns:
+            the cached rows, None if the key is missing or expired
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, rows = entry
+            if self.clock() < expires:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return rows
+            del self.entries[key]
+        self.misses += 1
+
+        return None
+
+    def put(self, key, rows):
+        self.entries[key] = (self.clock() + self.ttl, rows)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, tables=None):
+        """
+        - Drops the cached results of the tables, all of them if tables is None
+        """
+        if tables is None:
+            self.entries.clear()
+            return
+        for key in [key for key in self.entries if key[0] in tables]:
+            del self.entries[key]
+
+
+class QueryTables:
+    """
+    - Runs the three query patterns with prepared statements, each prepared on first use,
+      through an optional ResultCache
+    """
+
+    def __init__(self, session, cache=None):
+        self.session = session
+        self.cache = cache
+        self.prepared = {}
+
+    def query(self, table, *values):
+        """
+        Returns:
+            list of the rows of the table's query for the values of its ? placeholders
+        """
+        key = (table,) + values
+        if self.cache is not None:
+            rows = self.cache.get(key)
+            if rows is not None:
+                return rows
+
+        statement = self.prepared.get(table)
+        if statement is None:
+            statement = self.prepared[table] = self.session.prepare(QUERIES[table])
+        rows = list(self.session.execute(statement, values))
+
+        if self.cache is not None:
+            self.cache.put(key, rows)
+
+        return rows
+
+    def session_playlist(self, session_id, item_in_session):
+        """
+        Returns:
+            the artist, song and length heard at item_in_session of the session
+        """
+        return self.query('session_playlist', session_id, item_in_session)
+
+    def user_session(self, user_id, session_id):
+        """
+        Returns:
+            the artist, song and user name of each song of the user's session, in play order
+        """
+        return self.query('user_session', user_id, session_id)
+
+    def song_listeners(self, song):
+        """
+        Returns:
+            the first and last name of every user who listened to the song
+        """
+        return self.query('song_listeners', song)
+
+    def invalidate(self, tables=None):
+        """
+        - Drops the cached results of the tables, to be called when they are loaded by other means
+        """
+        if self.cache is not None:
+            self.cache.invalidate(tables)
+
+    def load(self, events, **kwargs):
+        """
+        - Loads the events with `load_tables`, then invalidates the cached results of the loaded tables
+        """
+        results = load_tables(self.session, events, **kwargs)
+        self.invalidate([r['table'] for r in results])
+
+        return results
+
+
+def sample_keys(events, requests, skew=1.1, seed=0):
+    """
+    - Draws a realistic mix of query keys from the loaded events: the three patterns in equal
+      parts, the keys of each following a Zipf distribution so a few are asked for far more
+      often than the rest, as popular songs and active sessions are
+    Args:
+        events (list): Events loaded in the tables
+        requests (int): number of keys drawn
+        skew (float): Zipf exponent, 0 draws the keys uniformly
+        seed (int): seed of the random draws
+    Returns:
+        list of (table, values) keys
+    """
+    rng = random.Random(seed)
+    keys = {
+        'session_playlist': sorted({(e.sessionId, e.itemInSession) for e in events}),
+        'user_session': sorted({(e.userId, e.sessionId) for e in events}),
+        'song_listeners': sorted({(e.song,) for e in events}),
+    }
+    draws = {}
+    for table, table_keys in keys.items():
+        rng.shuffle(table_keys)
+        weights = [1 / rank ** skew for rank in range(1, len(table_keys) + 1)]
+        draws[table] = iter(rng.choices(table_keys, weights, k=requests))
+
+    tables = [rng.choice(list(QUERIES)) for _ in range(requests)]
+
+    return [(table, next(draws[table])) for table in tables]
+
+
+def measure(queries, keys):
+    """
+    Returns:
+        list of the latency in seconds of each query
+    """
+    latencies = []
+    for table, values in keys:
+        start = time.perf_counter()
+        queries.query(table, *values)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def summarize(name, latencies):
+    """
+    Returns:
+        dict with the p50, p95 and p99 latencies in ms and the queries per second
+    """
+    q = statistics.quantiles(latencies, n=100)
+
+    return {
+        'run': name,
+        'queries': len(latencies),
+        'p50_ms': round(q[49] * 1000, 3),
+        'p95_ms': round(q[94] * 1000, 3),
+        'p99_ms': round(q[98] * 1000, 3),
+        'queries_per_sec': round(len(latencies) / sum(latencies), 1),
+    }
+
+
+def benchmark(session, events, requests=10000, skew=1.1, cache_size=1024, ttl=60.0, seed=0):
+    """
+    - Replays the same key mix without and with the result cache
+    Returns:
+        list of the summary of each run, and the cache used
+    """
+    keys = sample_keys(events, requests, skew, seed)
+    cache = ResultCache(cache_size, ttl)
+
+    results = [
+        summarize('no cache', measure(QueryTables(session), keys)),
+        summarize('cache', measure(QueryTables(session, cache), keys)),
+    ]
+
+    return results, cache
+
+
+def print_report(results):
+    """
+    - Prints the benchmark results as a table
+    """
+    columns = ['run', 'queries', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_sec']
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in results:
+        print('  '.join(str(r[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main():
+    """
+    - Benchmarks the query patterns with and without the result cache, against a loaded keyspace
+      or, with --local, against an in-process LocalSession loaded from the csv
+    Usage:
+        python query_tables.py [--local [--latency MS]] [--hosts HOST ...] [--keyspace NAME] [--file PATH]
+                               [--requests N] [--skew S] [--cache-size N] [--ttl SECONDS]
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the Cassandra query patterns with and without a result cache')
+    parser.add_argument('--local', action='store_true', help='query an in-process stand-in session instead of a cluster')
+    parser.add_argument('--latency', type=float, default=0.0, help='round trip in ms added to every request of the stand-in session')
+    parser.add_argument('--hosts', nargs='+', default=['127.0.0.1'], help='contact points of the cluster')
+    parser.add_argument('--keyspace', default='sparkify', help='keyspace holding the tables, loaded by load_tables.py')
+    parser.add_argument('--file', default='event_datafile_new.csv', help='event data csv the query keys are drawn from')
+    parser.add_argument('--requests', type=int, default=10000, help='number of queries per run')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of the key popularity (0 for uniform)')
+    parser.add_argument('--cache-size', type=int, default=1024, help='maximum number of cached results')
+    parser.add_argument('--ttl', type=float, default=60.0, help='seconds a cached result is served')
+    args = parser.parse_args()
+
+    events = list(read_events(args.file))
+
+    cluster = None
+    if args.local:
+        session = LocalSession()
+        create_tables(session)
+        for table, query, project, key_size in TABLES:
+            statement = session.prepare(query)
+            for event in events:
+                session.execute(statement, project(event))
+        session.latency = args.latency / 1000
+    else:
+        cluster, session = connect(args.hosts, args.keyspace)
+
+    results, cache = benchmark(session, events, args.requests, args.skew, args.cache_size, args.ttl)
+    print_report(results)
+    print('cache hit ratio {:.1%}'.format(cache.hits / (cache.hits + cache.misses)))
+
+    if cluster is not None:
+        session.shutdown()
+        cluster.shutdown()
+
+
+if __name__ == "__main__":
+    main()
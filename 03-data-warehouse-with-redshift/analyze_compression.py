@@ -0,0 +1,140 @@
+import argparse
+import configparser
+import re
+from collections import Counter
+import psycopg2
+from sql_queries import final_table_creates, analyze_compression, table_design_select, star_join_explain
+
+# column lines of the create queries, with the encoding they are created with
+COLUMN_ENCODE = re.compile(r'^(\s+)(\w+)(\s+.*?\bENCODE\s+)(\w+)( *)', re.MULTILINE)
+
+# join steps that move rows between nodes, DS_DIST_NONE and DS_DIST_ALL_NONE join in place
+REDISTRIBUTION_STEPS = {'DS_BCAST_INNER', 'DS_DIST_ALL_INNER', 'DS_DIST_INNER', 'DS_DIST_OUTER', 'DS_DIST_BOTH'}
+
+
+def get_encodings(create_query):
+    """
+        Description: returns the encoding of each column of a create query.
+
+        Parameters:
+            create_query    : the CREATE TABLE query, with an ENCODE on every column
+    """
+    return {m.group(2): m.group(4).upper() for m in COLUMN_ENCODE.finditer(create_query)}
+
+
+def analyze_table(cur, table, rows=100000):
+    """
+        Description: runs ANALYZE COMPRESSION on a sample of the rows of a table. Sort key columns come back with the encoding they have, as compressing them would make range restricted scans read more blocks.
+
+        Parameters:
+            cur     : the psycopg cursor
+            table   : the table analyzed
+            rows    : number of rows sampled
+
+        Returns:
+            dict of the column to its recommended encoding and estimated reduction in percent
+    """
+    cur.execute(analyze_compression.format(table=table, rows=rows))
+
+    return {column: (encoding.upper(), float(reduction)) for _, column, encoding, reduction in cur.fetchall()}
+
+
+def recommend_ddl(create_query, recommendations):
+    """
+        Description: rewrites the ENCODE of each column of a create query with its recommended encoding, keeping the distribution and sort keys.
+
+        Parameters:
+            create_query    : the CREATE TABLE query, as in sql_queries.py
+            recommendations : the results of analyze_table
+
+        Returns:
+            the recommended CREATE TABLE query
+    """
+    def replace(m):
+        encoding = recommendations.get(m.group(2), (m.group(4),))[0]
+        padding = max(len(m.group(4)) + len(m.group(5)) - len(encoding), 1) if m.group(5) else 0
+        return m.group(1) + m.group(2) + m.group(3) + encoding + ' ' * padding
+
+    return COLUMN_ENCODE.sub(replace, create_query)
+
+
+def get_table_design(cur, table):
+    """
+        Description: returns the distribution style, first sort key, rows and row skew across slices of a table, None if it is empty.
+
+        Parameters:
+            cur     : the psycopg cursor
+            table   : the table
+    """
+    cur.execute(table_design_select, (table,))
+
+    return cur.fetchone()
+
+
+def explain_star_join(cur):
+    """
+        Description: explains a query joining songplay to every dimension and counts the distribution of its join steps.
+
+        Parameters:
+            cur     : the psycopg cursor
+
+        Returns:
+            Counter of the DS_ attribute of each join step
+    """
+    cur.execute(star_join_explain)
+    plan = '\n'.join(row[0] for row in cur.fetchall())
+
+    return Counter(re.findall(r'\bDS_[A-Z_]+', plan))
+
+
+def main():
+    """
+        Description: recommends the column encodings of the final tables from their loaded data, prints the recommended DDL and checks the joins of the star schema do not move rows between nodes.
+    """
+    parser = argparse.ArgumentParser(description='Recommend column encodings for the final tables with ANALYZE COMPRESSION')
+    parser.add_argument('--tables', nargs='+', choices=list(final_table_creates), default=list(final_table_creates), help='tables analyzed')
+    parser.add_argument('--rows', type=int, default=100000, help='number of rows sampled per table')
+    parser.add_argument('--output', default=None, help='file the recommended DDL is written to')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    # ANALYZE COMPRESSION takes an exclusive lock on the table, released after each statement
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    ddl = []
+    for table in args.tables:
+        design = get_table_design(cur, table)
+        if design is None:
+            print('{} is empty, load it before analyzing it'.format(table))
+            continue
+        diststyle, sortkey, rows, skew = design
+        print('{}: {} rows, {}, sort key {}, row skew {}'.format(table, rows, diststyle, sortkey, skew))
+
+        current = get_encodings(final_table_creates[table])
+        recommendations = analyze_table(cur, table, args.rows)
+        for column, (encoding, reduction) in recommendations.items():
+            change = '' if encoding == current.get(column) else ' (now {})'.format(current.get(column))
+            print('    {:<16} {:<10} {:>6.2f}% smaller{}'.format(column, encoding, reduction, change))
+        ddl.append(recommend_ddl(final_table_creates[table], recommendations).strip() + ';')
+
+    steps = explain_star_join(cur)
+    moved = {step: count for step, count in steps.items() if step in REDISTRIBUTION_STEPS}
+    print('star join steps: {}'.format(', '.join('{} x{}'.format(step, count) for step, count in sorted(steps.items()))))
+    if moved:
+        print('rows are moved between nodes by {}, check the distribution of the joined tables'.format(', '.join(sorted(moved))))
+
+    conn.close()
+
+    print('\n\n'.join(ddl))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write('\n\n'.join(ddl) + '\n')
+        print('recommended DDL written to', args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import configparser
+import gzip
+import json
+import math
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import boto3
+from manifests import list_objects, split_s3_url
+
+
+# s3 client of each worker process, created on its first chunk
+_s3 = None
+
+
+def s3_settings(config):
+    """
+        Description: picks the s3 client settings of the config file, as a plain dict that can be sent to worker processes.
+
+        Parameters:
+            config  : the parsed dwh.cfg
+    """
+    return {'region_name': config.get('CLUSTER', 'REGION'),
+            'aws_access_key_id': config.get('AWS', 'KEY'),
+            'aws_secret_access_key': config.get('AWS', 'SECRET'),
+            'endpoint_url': config.get('S3', 'ENDPOINT_URL', fallback='') or None}
+
+
+def get_s3(settings):
+    """
+        Description: returns the s3 client of this process, creating it from the settings the first time.
+    """
+    global _s3
+    if _s3 is None:
+        _s3 = boto3.client('s3', **settings)
+
+    return _s3
+
+
+def is_s3(url):
+    return url.strip("'\"").startswith('s3://')
+
+
+def list_inputs(url, settings):
+    """
+        Description: lists the json files under an s3 prefix or a local directory.
+
+        Parameters:
+            url         : s3://bucket/prefix url or directory
+            settings    : the s3 client settings
+
+        Returns:
+            list of (url or path, size), in key or path order
+    """
+    if is_s3(url):
+        return list_objects(get_s3(settings), url)
+
+    files = []
+    for root, dirs, names in os.walk(url):
+        for name in names:
+            if name.endswith('.json'):
+                path = os.path.join(root, name)
+                files.append((path, os.path.getsize(path)))
+
+    return sorted(files)
+
+
+def read_input(url, settings):
+    """
+        Description: reads one input file from s3 or the local disk.
+    """
+    if is_s3(url):
+        bucket, key = split_s3_url(url)
+        return get_s3(settings).get_object(Bucket=bucket, Key=key)['Body'].read()
+
+    with open(url, 'rb') as f:
+        return f.read()
+
+
+def iter_documents(data):
+    """
+        Description: yields every json document of a file, whether it holds one (song_data) or one per line (log_data).
+
+        Parameters:
+            data    : the content of the file
+    """
+    decoder = json.JSONDecoder()
+    text = data.decode('utf8')
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos].isspace():
+            pos += 1
+        if pos == len(text):
+            return
+        document, pos = decoder.raw_decode(text, pos)
+        yield document
+
+
+def plan_chunks(files, chunk_bytes, slices=None):
+    """
+        Description: splits the files, in order, into chunks of about chunk_bytes of input each, optionally rounding the number of chunks up to a multiple of the slice count so every slice loads the same share.
+
+        Parameters:
+            files       : list of (url or path, size)
+            chunk_bytes : target input size of a chunk
+            slices      : number of slices of the cluster
+
+        Returns:
+            list of lists of (url or path, size)
+    """
+    total = sum(size for url, size in files)
+    count = max(1, math.ceil(total / chunk_bytes))
+    if slices:
+        count = math.ceil(count / slices) * slices
+    if count > len(files):
+        count = len(files) // slices * slices if slices and len(files) >= slices else len(files)
+
+    # a file opens the next chunk once its middle byte passes the chunk's share of the total, or
+    # when just enough files are left to give every remaining chunk one
+    chunks = []
+    position = 0
+    for index, (url, size) in enumerate(files):
+        boundary = len(chunks) * total / count
+        if not chunks or len(chunks) < count and (position + size / 2 >= boundary or len(files) - index == count - len(chunks)):
+            chunks.append([])
+        chunks[-1].append((url, size))
+        position += size
+
+    return chunks
+
+
+def write_chunk(files, output, settings):
+    """
+        Description: streams the documents of the files into one gzip json lines chunk, holding one input file in memory at a time.
+
+        Parameters:
+            files       : list of (url or path, size) of the chunk
+            output      : s3 url or path of the chunk written
+            settings    : the s3 client settings
+
+        Returns:
+            dict with the chunk, number of files, documents, input and output bytes
+    """
+    if is_s3(output):
+        fd, path = tempfile.mkstemp(suffix='.json.gz')
+        os.close(fd)
+    else:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        path = output + '.tmp'
+
+    documents = 0
+    with gzip.open(path, 'wt', encoding='utf8') as f:
+        for url, size in files:
+            for document in iter_documents(read_input(url, settings)):
+                f.write(json.dumps(document, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+                documents += 1
+    output_bytes = os.path.getsize(path)
+
+    if is_s3(output):
+        bucket, key = split_s3_url(output)
+        get_s3(settings).upload_file(path, bucket, key)
+        os.remove(path)
+    else:
+        os.replace(path, output)
+
+    return {'chunk': output, 'files': len(files), 'documents': documents,
+            'input_bytes': sum(size for url, size in files), 'output_bytes': output_bytes}
+
+
+def remove_stale_chunks(destination, outputs, settings):
+    """
+        Description: deletes the chunks of an earlier run under destination that this run did not write, as COPY would load every file under the prefix.
+
+        Parameters:
+            destination : s3://bucket/prefix url or directory of the chunks
+            outputs     : the chunks written by this run
+            settings    : the s3 client settings
+    """
+    keep = set(outputs)
+    if is_s3(destination):
+        stale = [url for url, size in list_objects(get_s3(settings), destination + '/part-') if url not in keep]
+        for url in stale:
+            bucket, key = split_s3_url(url)
+            get_s3(settings).delete_object(Bucket=bucket, Key=key)
+    else:
+        stale = [os.path.join(destination, name) for name in os.listdir(destination) if name.startswith('part-')]
+        stale = [path for path in stale if path not in keep]
+        for path in stale:
+            os.remove(path)
+
+    if stale:
+        print('{} stale chunks removed from {}'.format(len(stale), destination))
+
+
+def consolidate(source, destination, settings, chunk_bytes=64 * 1024 ** 2, workers=None, slices=None):
+    """
+        Description: packs the small json files under source into gzip json lines chunks under destination, on a pool of processes with at most two chunks per worker in flight.
+
+        Parameters:
+            source      : s3://bucket/prefix url or directory of the json files
+            destination : s3://bucket/prefix url or directory the chunks are written to
+            settings    : the s3 client settings
+            chunk_bytes : target input size of a chunk
+            workers     : number of worker processes, the number of cpus if not given
+            slices      : number of slices of the cluster, the number of chunks is rounded up to a multiple of it
+
+        Returns:
+            list of the written chunks, as returned by write_chunk
+    """
+    files = list_inputs(source, settings)
+    if not files:
+        print('no json files under', source)
+        return []
+
+    chunks = plan_chunks(files, chunk_bytes, slices)
+    destination = destination.strip("'\"").rstrip('/')
+    outputs = ['{}/part-{:05d}.json.gz'.format(destination, i) for i in range(len(chunks))]
+    print('{} files ({} bytes) under {} packed into {} chunks'.format(len(files), sum(size for url, size in files), source, len(chunks)))
+
+    written = []
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(zip(chunks, outputs))
+        pending = deque()
+        for chunk, output in remaining:
+            pending.append(executor.submit(write_chunk, chunk, output, settings))
+            if len(pending) >= 2 * workers:
+                written.append(pending.popleft().result())
+        while pending:
+            written.append(pending.popleft().result())
+    remove_stale_chunks(destination, outputs, settings)
+
+    for chunk in written:
+        print('{chunk}: {files} files, {documents} documents, {input_bytes} -> {output_bytes} bytes'.format(**chunk))
+
+    return written
+
+
+def main():
+    """
+        Description: packs song_data and log_data into gzip json lines chunks under CHUNK_PREFIX, or --input into --output.
+    """
+    parser = argparse.ArgumentParser(description='Pack small json files into gzip json lines chunks ahead of COPY')
+    parser.add_argument('--input', default=None, help='s3 url or directory of the json files, LOG_DATA and SONG_DATA if not given')
+    parser.add_argument('--output', default=None, help='s3 url or directory the chunks are written to, needed with --input')
+    parser.add_argument('--chunk-mb', type=float, default=64, help='target input size of a chunk in MB')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, the number of cpus if not given')
+    parser.add_argument('--slices', type=int, default=None, help='round the number of chunks up to a multiple of the slice count')
+    args = parser.parse_args()
+    if args.input and not args.output:
+        parser.error('--input needs --output')
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+    settings = s3_settings(config)
+    chunk_bytes = int(args.chunk_mb * 1024 ** 2)
+
+    if args.input:
+        pairs = [(args.input, args.output)]
+    else:
+        chunk_prefix = config.get('S3', 'CHUNK_PREFIX').strip("'\"").rstrip('/')
+        pairs = [(config.get('S3', 'LOG_DATA'), chunk_prefix + '/log_data'),
+                 (config.get('S3', 'SONG_DATA'), chunk_prefix + '/song_data')]
+
+    for source, destination in pairs:
+        consolidate(source, destination, settings, chunk_bytes, args.workers, args.slices)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,24 @@
+import argparse
 import configparser
 import psycopg2
 import re
-from sql_queries import copy_table_queries, insert_table_queries, validate_staging_queries, validate_insert_queries
+import time
+from manifests import load_staging_manifests
+from incremental import LOOKBACK, load_staging_increment, merge_tables
+from transform import run_dag, print_report
+from sql_queries import copy_table_queries, chunk_copy_queries, insert_table_dag, validate_staging_queries, validate_insert_queries
 
 
-def load_staging_tables(cur, conn):
+def load_staging_tables(cur, conn, queries=copy_table_queries):
     """
         Description: copies data from s3 to staging tables.
 
         Parameters:
             cur     : the psycopg cursor
             conn    : the connection to the data warehouse
+            queries : the copy queries, from the raw files by default
     """    
-    for query in copy_table_queries:
+    for query in queries:
         cur.execute(query)
         conn.commit()
 
@@ -31,17 +37,18 @@ def validate_staging(cur, conn):
         print(rows[0], "rows staged to ", table.group(1))
         conn.commit()
         
-def insert_tables(cur, conn):
+def insert_tables(connect, parallelism=4, dag=insert_table_dag):
     """
-        Description: inserts data from staging into the final tables.
+        Description: inserts data from staging into the final tables, running the inserts that do not depend on each other concurrently on their own connections.
 
         Parameters:
-            cur     : the psycopg cursor
-            conn    : the connection to the data warehouse
+            connect     : function returning a new connection to the data warehouse
+            parallelism : maximum number of inserts running at once, keep it within the WLM query slots
+            dag         : the insert queries and the tables each one reads
     """    
-    for query in insert_table_queries:
-        cur.execute(query)
-        conn.commit()
+    start = time.time()
+    results = run_dag(connect, dag, parallelism)
+    print_report(dag, results, time.time() - start)
 
 def validate_insert(cur, conn):
     """
@@ -63,24 +70,46 @@ def main():
     """
         Description: copies data from s3 to staging tables, before inserting into tables defined in the erd.
     """    
+    parser = argparse.ArgumentParser(description='Load the staging tables from s3 and insert into the star schema')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--manifest', action='store_true', help='copy the staging tables through manifests written by manifests.py')
+    source.add_argument('--chunks', action='store_true', help='copy the staging tables from the gzip chunks written by consolidate_files.py')
+    source.add_argument('--incremental', action='store_true', help='stage only the objects newer than the watermarks and merge them into the tables')
+    parser.add_argument('--slices', type=int, default=None, help='number of slices of the cluster, read from stv_slices if not given')
+    parser.add_argument('--max-files', type=int, default=1000, help='maximum number of files per manifest')
+    parser.add_argument('--lookback', type=int, default=LOOKBACK, help='with --incremental, seconds before the watermark listed again for objects uploaded late')
+    parser.add_argument('--parallelism', type=int, default=4, help='maximum number of inserts running at once, 1 runs them one after the other')
+    args = parser.parse_args()
+
     config = configparser.ConfigParser()
     config.read('dwh.cfg')
     print('-- RUNNING ETL--')
 
-    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    dsn = "host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values())
+    conn = psycopg2.connect(dsn)
     print('1 of 8 -- Connection Successful @{}:{}/{}'.format(config['CLUSTER']['HOST'], config['CLUSTER']['DB_PORT'], config['CLUSTER']['DB_NAME']))
     
     cur = conn.cursor()
     print('2 of 8 -- Cursor Created')
 
     print('3 of 8 -- Loading to Staging')
-    load_staging_tables(cur, conn)
+    if args.incremental:
+        watermarks, loaded = load_staging_increment(cur, conn, config, args.slices, args.max_files, lookback=args.lookback)
+    elif args.manifest:
+        load_staging_manifests(cur, conn, config, args.slices, args.max_files)
+    elif args.chunks:
+        load_staging_tables(cur, conn, chunk_copy_queries)
+    else:
+        load_staging_tables(cur, conn)
     print('4 of 8 -- Loaded to Staging')
 
     validate_staging(cur, conn)
     print('5 of 8 -- Staging Validated')
     
-    insert_tables(cur, conn)
+    if args.incremental:
+        merge_tables(cur, conn, watermarks, loaded, args.lookback)
+    else:
+        insert_tables(lambda: psycopg2.connect(dsn), args.parallelism)
     print('6 of 8 -- Inserted into Tables')
 
     validate_insert(cur, conn)
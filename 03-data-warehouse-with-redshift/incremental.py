@@ -0,0 +1,192 @@
+import argparse
+import configparser
+import time
+from datetime import datetime, timedelta, timezone
+import psycopg2
+from psycopg2.extras import execute_values
+from manifests import s3_client, split_s3_url, write_table_manifests, copy_manifests, write_load_log, get_slice_count
+from sql_queries import (manifest_copy_queries, truncate_staging_queries, merge_table_queries,
+                         watermark_select, watermark_delete, watermark_insert,
+                         loaded_objects_select, loaded_objects_insert, loaded_objects_template, loaded_objects_prune)
+
+# s3 LastModified is the time an upload started, to the second, so an object can be listed after
+# the watermark has passed it; objects this many seconds older than the watermark are listed again
+LOOKBACK = 3600
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def get_watermark(cur, source):
+    """
+        Description: returns the watermark of a source, the (last_modified, key) of the newest object loaded from it, None if it was never loaded.
+
+        Parameters:
+            cur     : the psycopg cursor
+            source  : the s3 url of the source, as in dwh.cfg
+    """
+    cur.execute(watermark_select, (source,))
+    row = cur.fetchone()
+
+    return tuple(row) if row else None
+
+
+def lookback_cutoff(watermark, lookback=LOOKBACK):
+    """
+        Description: returns the last_modified from which objects are listed again, lookback seconds before the watermark, None to list all of them.
+
+        Parameters:
+            watermark   : (last_modified, key) of the newest object already loaded, None if none was
+            lookback    : seconds before the watermark listed again
+    """
+    if watermark is None:
+        return None
+    last_modified = datetime.strptime(watermark[0], TIMESTAMP_FORMAT) - timedelta(seconds=lookback)
+
+    return last_modified.strftime(TIMESTAMP_FORMAT)
+
+
+def get_loaded_keys(cur, source, cutoff):
+    """
+        Description: returns the keys of the objects of a source already loaded, last modified from the cutoff on.
+
+        Parameters:
+            cur     : the psycopg cursor
+            source  : the s3 url of the source, as in dwh.cfg
+            cutoff  : the lookback cutoff, None when nothing was loaded yet
+    """
+    if cutoff is None:
+        return set()
+    cur.execute(loaded_objects_select, (source, cutoff))
+
+    return {row[0] for row in cur.fetchall()}
+
+
+def list_new_objects(s3, url, watermark=None, loaded_keys=(), lookback=LOOKBACK):
+    """
+        Description: lists the objects under an s3 prefix not loaded yet: those last modified since lookback seconds before the watermark whose keys were not loaded, so objects listed late or in the same second as the watermark are not skipped.
+
+        Parameters:
+            s3          : the s3 client
+            url         : the s3://bucket/prefix url
+            watermark   : (last_modified, key) of the newest object already loaded, None for all of them
+            loaded_keys : keys of the objects already loaded since the lookback cutoff
+            lookback    : seconds before the watermark listed again
+
+        Returns:
+            list of (url, size, last_modified) of the new objects, ordered by (last_modified, key), and the watermark after loading them
+    """
+    bucket, prefix = split_s3_url(url)
+    cutoff = lookback_cutoff(watermark, lookback)
+    objects = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Size'] == 0 or obj['Key'] in loaded_keys:
+                continue
+            last_modified = obj['LastModified'].astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+            if cutoff is None or last_modified >= cutoff:
+                objects.append((last_modified, obj['Key'], obj['Size']))
+    objects.sort()
+
+    new_watermark = max(filter(None, [watermark, objects[-1][:2] if objects else None]), default=None)
+    return [('s3://{}/{}'.format(bucket, key), size, last_modified) for last_modified, key, size in objects], new_watermark
+
+
+def load_staging_increment(cur, conn, config, slices=None, max_files=1000, run_id=None, lookback=LOOKBACK):
+    """
+        Description: truncates the staging tables and copies into them, through manifests, only the objects of each source not loaded yet.
+
+        Parameters:
+            cur         : the psycopg cursor
+            conn        : the connection to the data warehouse
+            config      : the parsed dwh.cfg
+            slices      : number of slices of the cluster, read from stv_slices if not given
+            max_files   : maximum number of files per manifest
+            run_id      : name of the run, the current time if not given
+            lookback    : seconds before the watermark listed again
+
+        Returns:
+            dict of the source to its watermark after the load and dict of the source to the (key, last_modified) of the objects loaded, to be saved by merge_tables
+    """
+    s3 = s3_client(config)
+    manifest_prefix = config.get('S3', 'MANIFEST_PREFIX')
+    run_id = run_id or time.strftime('%Y%m%dT%H%M%S')
+    slices = slices or get_slice_count(cur)
+
+    loads = []
+    watermarks = {}
+    loaded = {}
+    for table, source, query in manifest_copy_queries:
+        cur.execute(truncate_staging_queries[table])
+        conn.commit()
+
+        watermark = get_watermark(cur, source)
+        loaded_keys = get_loaded_keys(cur, source, lookback_cutoff(watermark, lookback))
+        objects, watermarks[source] = list_new_objects(s3, source, watermark, loaded_keys, lookback)
+        print('{} new files under {} since {}'.format(len(objects), source, lookback_cutoff(watermark, lookback) or 'the first load'))
+        loaded[source] = [(split_s3_url(url)[1], last_modified) for url, size, last_modified in objects]
+        objects = [(url, size) for url, size, last_modified in objects]
+        loads.extend(write_table_manifests(s3, manifest_prefix, run_id, table, query, objects, slices, max_files))
+
+    copy_manifests(cur, conn, loads)
+    print('load log written to', write_load_log(s3, manifest_prefix, run_id, loads))
+
+    failed = [load['manifest'] for load in loads if load['status'] != 'loaded']
+    if failed:
+        raise RuntimeError('{} manifests failed to load, watermarks left unchanged: {}'.format(len(failed), ', '.join(failed)))
+
+    return {source: watermark for source, watermark in watermarks.items() if watermark is not None}, loaded
+
+
+def merge_tables(cur, conn, watermarks, loaded, lookback=LOOKBACK):
+    """
+        Description: merges the staged increment into the final tables, records the objects loaded and moves the watermarks forward in one transaction, so a failed merge is retried from the same objects. Records of objects older than the lookback window are dropped, as they are not listed again.
+
+        Parameters:
+            cur         : the psycopg cursor
+            conn        : the connection to the data warehouse
+            watermarks  : the watermarks returned by load_staging_increment
+            loaded      : the objects loaded, returned by load_staging_increment
+            lookback    : seconds before the watermark listed again
+    """
+    try:
+        for query in merge_table_queries:
+            cur.execute(query)
+        for source, objects in loaded.items():
+            if objects:
+                execute_values(cur, loaded_objects_insert, [(source, key, last_modified) for key, last_modified in objects],
+                               template=loaded_objects_template, page_size=1000)
+        for source, (last_modified, last_key) in watermarks.items():
+            cur.execute(watermark_delete, (source,))
+            cur.execute(watermark_insert, (source, last_modified, last_key))
+            cur.execute(loaded_objects_prune, (source, lookback_cutoff((last_modified, last_key), lookback)))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+
+def main():
+    """
+        Description: loads the objects added since the last run into the data warehouse without rebuilding it.
+    """
+    parser = argparse.ArgumentParser(description='Incremental load of the data warehouse')
+    parser.add_argument('--slices', type=int, default=None, help='number of slices of the cluster, read from stv_slices if not given')
+    parser.add_argument('--max-files', type=int, default=1000, help='maximum number of files per manifest')
+    parser.add_argument('--lookback', type=int, default=LOOKBACK, help='seconds before the watermark listed again for objects uploaded late')
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    cur = conn.cursor()
+
+    watermarks, loaded = load_staging_increment(cur, conn, config, args.slices, args.max_files, lookback=args.lookback)
+    merge_tables(cur, conn, watermarks, loaded, args.lookback)
+    print('-- INCREMENT MERGED --')
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
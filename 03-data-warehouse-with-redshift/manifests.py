@@ -0,0 +1,256 @@
+import argparse
+import configparser
+import json
+import time
+import boto3
+import psycopg2
+from sql_queries import manifest_copy_queries, slice_count_select
+
+
+def s3_client(config):
+    """
+        Description: creates the s3 client from the credentials in the config file, pointed at ENDPOINT_URL when set (e.g. a local s3 stand-in).
+
+        Parameters:
+            config  : the parsed dwh.cfg
+    """
+    return boto3.client('s3',
+                        region_name=config.get('CLUSTER', 'REGION'),
+                        aws_access_key_id=config.get('AWS', 'KEY'),
+                        aws_secret_access_key=config.get('AWS', 'SECRET'),
+                        endpoint_url=config.get('S3', 'ENDPOINT_URL', fallback='') or None
+                        )
+
+
+def split_s3_url(url):
+    """
+        Description: splits an s3 url, quoted as in dwh.cfg or not, into its bucket and key or prefix.
+
+        Parameters:
+            url     : the s3://bucket/prefix url
+    """
+    bucket, _, prefix = url.strip("'\"").replace('s3://', '', 1).partition('/')
+
+    return bucket, prefix
+
+
+def list_objects(s3, url):
+    """
+        Description: lists the objects under an s3 prefix, the same objects COPY would load from it.
+
+        Parameters:
+            s3      : the s3 client
+            url     : the s3://bucket/prefix url
+
+        Returns:
+            list of (url, size) of the non empty objects, in key order
+    """
+    bucket, prefix = split_s3_url(url)
+    objects = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Size'] > 0:
+                objects.append(('s3://{}/{}'.format(bucket, obj['Key']), obj['Size']))
+
+    return objects
+
+
+def get_slice_count(cur):
+    """
+        Description: returns the number of slices of the cluster, each of which loads one file at a time during a COPY.
+
+        Parameters:
+            cur     : the psycopg cursor
+    """
+    cur.execute(slice_count_select)
+
+    return cur.fetchone()[0]
+
+
+def split_files(objects, slices, max_files):
+    """
+        Description: splits the objects into groups of a multiple of the slice count, so every slice has a file to load for the whole COPY of each group, the remainder going into the last group.
+
+        Parameters:
+            objects     : list of (url, size)
+            slices      : number of slices of the cluster
+            max_files   : maximum number of files per group, rounded down to a multiple of the slice count
+
+        Returns:
+            list of lists of (url, size)
+    """
+    group_size = max(slices, max_files // slices * slices)
+
+    return [objects[i:i + group_size] for i in range(0, len(objects), group_size)]
+
+
+def write_manifest(s3, url, objects):
+    """
+        Description: writes a COPY manifest listing the objects, every one of them mandatory.
+
+        Parameters:
+            s3      : the s3 client
+            url     : the s3 url of the manifest
+            objects : list of (url, size)
+    """
+    bucket, key = split_s3_url(url)
+    manifest = {'entries': [{'url': obj_url, 'mandatory': True, 'meta': {'content_length': size}} for obj_url, size in objects]}
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(manifest, indent=1).encode('utf8'))
+
+
+def write_table_manifests(s3, manifest_prefix, run_id, table, query, objects, slices, max_files=1000):
+    """
+        Description: writes the objects of one staging table as manifests under manifest_prefix/run_id.
+
+        Parameters:
+            s3              : the s3 client
+            manifest_prefix : the s3 url the manifests are written under
+            run_id          : name of the run, keeps the manifests of each run apart
+            table           : the staging table
+            query           : the manifest copy query of the table
+            objects         : list of (url, size) loaded into the table
+            slices          : number of slices of the cluster
+            max_files       : maximum number of files per manifest
+
+        Returns:
+            list of the loads, a dict with the table, manifest url, copy query, files and bytes of each
+    """
+    loads = []
+    for i, group in enumerate(split_files(objects, slices, max_files)):
+        manifest = '{}/{}/{}-{:04d}.manifest'.format(manifest_prefix.strip("'\"").rstrip('/'), run_id, table, i)
+        write_manifest(s3, manifest, group)
+        loads.append({'table': table, 'manifest': manifest, 'query': query, 'files': len(group), 'bytes': sum(size for url, size in group)})
+
+    return loads
+
+
+def write_manifests(s3, manifest_prefix, run_id, slices, max_files=1000, queries=manifest_copy_queries):
+    """
+        Description: lists the input objects of each staging table and writes them as manifests under manifest_prefix/run_id.
+
+        Parameters:
+            s3              : the s3 client
+            manifest_prefix : the s3 url the manifests are written under
+            run_id          : name of the run, keeps the manifests of each run apart
+            slices          : number of slices of the cluster
+            max_files       : maximum number of files per manifest
+            queries         : (table, source url, copy query) of each staging table
+
+        Returns:
+            list of the loads, a dict with the table, manifest url, copy query, files and bytes of each
+    """
+    loads = []
+    for table, source, query in queries:
+        objects = list_objects(s3, source)
+        table_loads = write_table_manifests(s3, manifest_prefix, run_id, table, query, objects, slices, max_files)
+        print('{} files ({} bytes) under {} in {} manifests'.format(len(objects), sum(size for url, size in objects), source, len(table_loads)))
+        loads.extend(table_loads)
+
+    return loads
+
+
+def copy_manifests(cur, conn, loads):
+    """
+        Description: copies each manifest into its staging table, recording the duration and status of every load.
+
+        Parameters:
+            cur     : the psycopg cursor
+            conn    : the connection to the data warehouse
+            loads   : the loads returned by write_manifests
+    """
+    for load in loads:
+        start = time.time()
+        try:
+            cur.execute(load['query'].format(manifest=load['manifest']))
+            conn.commit()
+            load['status'] = 'loaded'
+        except psycopg2.Error as e:
+            conn.rollback()
+            load['status'] = 'failed: {}'.format(str(e).strip().splitlines()[0])
+        load['seconds'] = round(time.time() - start, 3)
+        print('{} -> {}: {} files in {}s, {}'.format(load['manifest'], load['table'], load['files'], load['seconds'], load['status']))
+
+
+def write_load_log(s3, manifest_prefix, run_id, loads):
+    """
+        Description: writes the record of the run next to its manifests, which list the objects that went into each load.
+
+        Parameters:
+            s3              : the s3 client
+            manifest_prefix : the s3 url the manifests are written under
+            run_id          : name of the run
+            loads           : the loads of the run
+
+        Returns:
+            the s3 url of the load log
+    """
+    url = '{}/{}/loads.json'.format(manifest_prefix.strip("'\"").rstrip('/'), run_id)
+    bucket, key = split_s3_url(url)
+    log = [{k: v for k, v in load.items() if k != 'query'} for load in loads]
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps({'run_id': run_id, 'loads': log}, indent=1).encode('utf8'))
+
+    return url
+
+
+def load_staging_manifests(cur, conn, config, slices=None, max_files=1000, run_id=None):
+    """
+        Description: lists the input objects, writes the manifests, copies them into the staging tables and records the run, raising if any manifest failed to load.
+
+        Parameters:
+            cur         : the psycopg cursor
+            conn        : the connection to the data warehouse
+            config      : the parsed dwh.cfg
+            slices      : number of slices of the cluster, read from stv_slices if not given
+            max_files   : maximum number of files per manifest
+            run_id      : name of the run, the current time if not given
+
+        Returns:
+            the loads of the run
+    """
+    s3 = s3_client(config)
+    manifest_prefix = config.get('S3', 'MANIFEST_PREFIX')
+    run_id = run_id or time.strftime('%Y%m%dT%H%M%S')
+    slices = slices or get_slice_count(cur)
+
+    loads = write_manifests(s3, manifest_prefix, run_id, slices, max_files)
+    copy_manifests(cur, conn, loads)
+    print('load log written to', write_load_log(s3, manifest_prefix, run_id, loads))
+
+    failed = [load['manifest'] for load in loads if load['status'] != 'loaded']
+    if failed:
+        raise RuntimeError('{} manifests failed to load, the staging tables are incomplete: {}'.format(len(failed), ', '.join(failed)))
+
+    return loads
+
+
+def main():
+    """
+        Description: writes the staging manifests and, unless --dry-run, copies them into the staging tables.
+    """
+    parser = argparse.ArgumentParser(description='Load the staging tables through COPY manifests')
+    parser.add_argument('--slices', type=int, default=None, help='number of slices of the cluster, read from stv_slices if not given')
+    parser.add_argument('--max-files', type=int, default=1000, help='maximum number of files per manifest')
+    parser.add_argument('--run-id', default=None, help='name of the run the manifests are written under')
+    parser.add_argument('--dry-run', action='store_true', help='only list the objects and write the manifests, needs --slices')
+    args = parser.parse_args()
+    if args.dry_run and not args.slices:
+        parser.error('--dry-run needs --slices')
+
+    config = configparser.ConfigParser()
+    config.read('dwh.cfg')
+
+    if args.dry_run:
+        s3 = s3_client(config)
+        run_id = args.run_id or time.strftime('%Y%m%dT%H%M%S')
+        loads = write_manifests(s3, config.get('S3', 'MANIFEST_PREFIX'), run_id, args.slices, args.max_files)
+        print('load log written to', write_load_log(s3, config.get('S3', 'MANIFEST_PREFIX'), run_id, loads))
+        return
+
+    conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(*config['CLUSTER'].values()))
+    cur = conn.cursor()
+    load_staging_manifests(cur, conn, config, args.slices, args.max_files, args.run_id)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,11 @@ staging_events_table_drop = "DROP TABLE IF EXISTS staging_events"
 staging_songs_table_drop = "DROP TABLE IF EXISTS staging_songs"
 songplay_table_drop = "DROP TABLE IF EXISTS songplay"
 user_table_drop = "DROP TABLE IF EXISTS users"
-song_table_drop = "DROP TABLE IF EXISTS songs"
-artist_table_drop = "DROP TABLE IF EXISTS artists"
+song_table_drop = "DROP TABLE IF EXISTS song"
+artist_table_drop = "DROP TABLE IF EXISTS artist"
 time_table_drop = "DROP TABLE IF EXISTS time"
+watermark_table_drop = "DROP TABLE IF EXISTS etl_watermarks"
+loaded_objects_table_drop = "DROP TABLE IF EXISTS etl_loaded_objects"
 
 
 # CREATE TABLES
@@ -58,64 +60,99 @@ staging_songs_table_create = ("""
     )
 """)
 
+# the dimensions are small enough to be copied whole to every node (DISTSTYLE ALL), so songplay
+# joins them without moving rows; songplay is spread on song_id and sorted on start_time.
+# sort key columns stay RAW, numbers and timestamps are AZ64, low cardinality text BYTEDICT and
+# other text ZSTD, see analyze_compression.py for the encodings measured on the loaded data
+
 user_table_create = ("""
     CREATE TABLE IF NOT EXISTS users
-(
-        user_id         INT     NOT NULL PRIMARY KEY,
-        first_name      TEXT    NOT NULL,
-        last_name       TEXT    NOT NULL,
-        gender          TEXT,
-        level           TEXT
+    (
+        user_id         INT         ENCODE RAW      NOT NULL PRIMARY KEY,
+        first_name      TEXT        ENCODE ZSTD     NOT NULL,
+        last_name       TEXT        ENCODE ZSTD     NOT NULL,
+        gender          TEXT        ENCODE BYTEDICT,
+        level           TEXT        ENCODE BYTEDICT
     )
+    DISTSTYLE ALL
+    SORTKEY (user_id)
 """)
 
 song_table_create = ("""
     CREATE TABLE IF NOT EXISTS song
     (
-        song_id         TEXT    NOT NULL PRIMARY KEY,
-        title           TEXT    NOT NULL,
-        artist_id       TEXT    NOT NULL,
-        year            INT     NOT NULL,
-        duration        FLOAT   NOT NULL
+        song_id         TEXT        ENCODE RAW      NOT NULL PRIMARY KEY,
+        title           TEXT        ENCODE ZSTD     NOT NULL,
+        artist_id       TEXT        ENCODE ZSTD     NOT NULL,
+        year            INT         ENCODE AZ64     NOT NULL,
+        duration        FLOAT       ENCODE ZSTD     NOT NULL
     )
+    DISTSTYLE ALL
+    SORTKEY (song_id)
 """)
 
 artist_table_create = ("""
     CREATE TABLE IF NOT EXISTS artist
     (
-        artist_id       TEXT    NOT NULL PRIMARY KEY,
-        name            TEXT    NOT NULL,
-        location        TEXT,
-        latitude        FLOAT,
-        longitude       FLOAT
+        artist_id       TEXT        ENCODE RAW      NOT NULL PRIMARY KEY,
+        name            TEXT        ENCODE ZSTD     NOT NULL,
+        location        TEXT        ENCODE ZSTD,
+        latitude        FLOAT       ENCODE ZSTD,
+        longitude       FLOAT       ENCODE ZSTD
     )
+    DISTSTYLE ALL
+    SORTKEY (artist_id)
 """)
 
 time_table_create = ("""
     CREATE TABLE IF NOT EXISTS time 
     (
-        start_time      TIMESTAMP   NOT NULL PRIMARY KEY,                      
-        hour            INT         NOT NULL,
-        day             INT         NOT NULL,
-        week            INT         NOT NULL,
-        month           INT         NOT NULL,
-        year            INT         NOT NULL,
-        weekday         TEXT        NOT NULL
+        start_time      TIMESTAMP   ENCODE RAW      NOT NULL PRIMARY KEY,
+        hour            INT         ENCODE AZ64     NOT NULL,
+        day             INT         ENCODE AZ64     NOT NULL,
+        week            INT         ENCODE AZ64     NOT NULL,
+        month           INT         ENCODE AZ64     NOT NULL,
+        year            INT         ENCODE AZ64     NOT NULL,
+        weekday         TEXT        ENCODE BYTEDICT NOT NULL
     )
+    DISTSTYLE ALL
+    SORTKEY (start_time)
 """)
 
 songplay_table_create = ("""
     CREATE TABLE IF NOT EXISTS songplay
     (
-        songplay_id     INT         IDENTITY(0,1) PRIMARY KEY,
-        start_time      TIMESTAMP   NOT NULL REFERENCES time(start_time),
-        user_id         INT         NOT NULL REFERENCES users(user_id),
-        level           TEXT,
-        song_id         TEXT        NOT NULL REFERENCES song(song_id),
-        artist_id       TEXT        NOT NULL REFERENCES artist(artist_id),
-        session_id      INT,
-        location        TEXT,
-        user_agent      TEXT
+        songplay_id     INT         IDENTITY(0,1) ENCODE AZ64 PRIMARY KEY,
+        start_time      TIMESTAMP   ENCODE RAW      NOT NULL REFERENCES time(start_time),
+        user_id         INT         ENCODE AZ64     NOT NULL REFERENCES users(user_id),
+        level           TEXT        ENCODE BYTEDICT,
+        song_id         TEXT        ENCODE ZSTD     NOT NULL REFERENCES song(song_id),
+        artist_id       TEXT        ENCODE ZSTD     NOT NULL REFERENCES artist(artist_id),
+        session_id      INT         ENCODE AZ64,
+        location        TEXT        ENCODE ZSTD,
+        user_agent      TEXT        ENCODE ZSTD
+    )
+    DISTKEY (song_id)
+    SORTKEY (start_time)
+""")
+
+watermark_table_create = ("""
+    CREATE TABLE IF NOT EXISTS etl_watermarks
+    (
+        source          VARCHAR(1024)   NOT NULL PRIMARY KEY,
+        last_modified   VARCHAR(32)     NOT NULL,
+        last_key        VARCHAR(1024)   NOT NULL,
+        loaded_at       TIMESTAMP       NOT NULL
+    )
+""")
+
+loaded_objects_table_create = ("""
+    CREATE TABLE IF NOT EXISTS etl_loaded_objects
+    (
+        source          VARCHAR(1024)   NOT NULL,
+        object_key      VARCHAR(1024)   NOT NULL,
+        last_modified   VARCHAR(32)     NOT NULL,
+        loaded_at       TIMESTAMP       NOT NULL
     )
 """)
 
@@ -145,6 +182,64 @@ staging_songs_copy = ("""
             region=config['CLUSTER']['REGION'])
 
 
+# STAGING TABLES FROM MANIFESTS
+# {manifest} is the s3 url of a manifest written by manifests.py
+
+staging_events_manifest_copy = ("""
+    COPY staging_events
+    FROM '{{manifest}}'
+    CREDENTIALS 'aws_iam_role={role_arn}'
+    REGION '{region}'
+    FORMAT JSON {log_json_path}
+    TIMEFORMAT AS 'epochmillisecs'
+    MANIFEST;
+""").format(role_arn=config['IAM_ROLE']['ARN'],
+            log_json_path=config['S3']['LOG_JSONPATH'],
+            region=config['CLUSTER']['REGION'])
+
+staging_songs_manifest_copy = ("""
+    COPY staging_songs
+    FROM '{{manifest}}'
+    CREDENTIALS 'aws_iam_role={role_arn}'
+    REGION '{region}'
+    FORMAT JSON 'auto'
+    MANIFEST;
+""").format(role_arn=config['IAM_ROLE']['ARN'],
+            region=config['CLUSTER']['REGION'])
+
+# STAGING TABLES FROM CHUNKS
+# gzip json lines chunks written by consolidate_files.py under CHUNK_PREFIX
+
+staging_events_chunks_copy = ("""
+    COPY staging_events
+    FROM '{chunk_prefix}/log_data/part-'
+    CREDENTIALS 'aws_iam_role={role_arn}'
+    REGION '{region}'
+    FORMAT JSON {log_json_path}
+    TIMEFORMAT AS 'epochmillisecs'
+    GZIP;
+""").format(chunk_prefix=config['S3']['CHUNK_PREFIX'].strip("'").rstrip('/'),
+            role_arn=config['IAM_ROLE']['ARN'],
+            log_json_path=config['S3']['LOG_JSONPATH'],
+            region=config['CLUSTER']['REGION'])
+
+staging_songs_chunks_copy = ("""
+    COPY staging_songs
+    FROM '{chunk_prefix}/song_data/part-'
+    CREDENTIALS 'aws_iam_role={role_arn}'
+    REGION '{region}'
+    FORMAT JSON 'auto'
+    GZIP;
+""").format(chunk_prefix=config['S3']['CHUNK_PREFIX'].strip("'").rstrip('/'),
+            role_arn=config['IAM_ROLE']['ARN'],
+            region=config['CLUSTER']['REGION'])
+
+slice_count_select = ("""
+    SELECT COUNT(*)
+    FROM stv_slices;
+""")
+
+
 
 # FINAL TABLES
 
@@ -211,6 +306,130 @@ time_table_insert = ("""
 """)
 
 
+# INCREMENTAL LOADS
+# staging holds only the objects of their source not loaded yet: those listed since the watermark
+# less a lookback window, as s3 timestamps are not arrival order, minus the keys recorded in
+# etl_loaded_objects. the dimensions are merged with delete+insert and songplay / time only get
+# the rows they do not have yet
+
+staging_events_truncate = "TRUNCATE staging_events;"
+staging_songs_truncate = "TRUNCATE staging_songs;"
+
+watermark_select = ("""
+    SELECT last_modified, last_key
+    FROM etl_watermarks
+    WHERE source = %s;
+""")
+
+watermark_delete = ("""
+    DELETE FROM etl_watermarks
+    WHERE source = %s;
+""")
+
+watermark_insert = ("""
+    INSERT INTO etl_watermarks (source, last_modified, last_key, loaded_at)
+    VALUES (%s, %s, %s, GETDATE());
+""")
+
+loaded_objects_select = ("""
+    SELECT object_key
+    FROM etl_loaded_objects
+    WHERE source = %s
+    AND last_modified >= %s;
+""")
+
+# run with psycopg2.extras.execute_values, one row of (source, key, last modified) per object
+loaded_objects_insert = ("""
+    INSERT INTO etl_loaded_objects (source, object_key, last_modified, loaded_at)
+    VALUES %s;
+""")
+loaded_objects_template = "(%s, %s, %s, GETDATE())"
+
+loaded_objects_prune = ("""
+    DELETE FROM etl_loaded_objects
+    WHERE source = %s
+    AND last_modified < %s;
+""")
+
+user_table_merge_delete = ("""
+    DELETE FROM users
+    USING staging_events e
+    WHERE users.user_id = e.userId
+    AND e.page  =  'NextSong';
+""")
+
+user_table_merge_insert = ("""
+    INSERT INTO users (user_id, first_name, last_name, gender, level)
+    SELECT  userId      AS user_id,
+            firstName   AS first_name,
+            lastName    AS last_name,
+            gender,
+            level
+    FROM (
+        SELECT  userId, firstName, lastName, gender, level,
+                ROW_NUMBER() OVER (PARTITION BY userId ORDER BY ts DESC) AS recency
+        FROM staging_events
+        WHERE userId IS NOT NULL
+        AND page  =  'NextSong'
+    ) latest
+    WHERE recency = 1;
+""")
+
+song_table_merge_delete = ("""
+    DELETE FROM song
+    USING staging_songs s
+    WHERE song.song_id = s.song_id;
+""")
+
+artist_table_merge_delete = ("""
+    DELETE FROM artist
+    USING staging_songs s
+    WHERE artist.artist_id = s.artist_id;
+""")
+
+songplay_table_append = ("""
+    INSERT INTO songplay
+        (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+    SELECT DISTINCT(e.ts) AS start_time,
+        e.userId        AS user_id,
+        e.level         AS level,
+        s.song_id       AS song_id,
+        s.artist_id     AS artist_id,
+        e.sessionId     AS session_id,
+        e.location      AS location,
+        e.userAgent     AS user_agent
+    FROM staging_events e
+    JOIN song   s   ON (e.song = s.title)
+    JOIN artist a   ON (s.artist_id = a.artist_id AND e.artist = a.name)
+    WHERE e.page  =  'NextSong'
+    AND NOT EXISTS (
+        SELECT 1
+        FROM songplay sp
+        WHERE sp.start_time = e.ts
+        AND sp.user_id = e.userId
+        AND sp.session_id = e.sessionId
+    );
+""")
+
+time_table_append = ("""
+    INSERT INTO time (start_time, hour, day, week, month, year, weekday)
+    SELECT  DISTINCT(sp.start_time)                 AS start_time,
+            EXTRACT(hour FROM sp.start_time)        AS hour,
+            EXTRACT(day FROM sp.start_time)         AS day,
+            EXTRACT(week FROM sp.start_time)        AS week,
+            EXTRACT(month FROM sp.start_time)       AS month,
+            EXTRACT(year FROM sp.start_time)        AS year,
+            EXTRACT(dayofweek FROM sp.start_time)   AS weekday
+    FROM songplay sp
+    JOIN (SELECT DISTINCT ts FROM staging_events WHERE page  =  'NextSong') e ON (sp.start_time = e.ts)
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM time t
+        WHERE t.start_time = sp.start_time
+    );
+""")
+
+
 # STAGING TABLE VALIDATION
 
 staging_events_rows = ("""
@@ -252,11 +471,49 @@ time_rows = ("""
 """)
 
 
+# PHYSICAL DESIGN
+# run by analyze_compression.py on the loaded tables
+
+analyze_compression = ("""
+    ANALYZE COMPRESSION {table} COMPROWS {rows};
+""")
+
+table_design_select = ("""
+    SELECT diststyle, sortkey1, tbl_rows, skew_rows
+    FROM svv_table_info
+    WHERE "table" = %s;
+""")
+
+star_join_explain = ("""
+    EXPLAIN
+    SELECT  t.year, t.month, u.level, a.name, s.title, COUNT(*)
+    FROM songplay sp
+    JOIN time t     ON (sp.start_time = t.start_time)
+    JOIN users u    ON (sp.user_id = u.user_id)
+    JOIN song s     ON (sp.song_id = s.song_id)
+    JOIN artist a   ON (sp.artist_id = a.artist_id)
+    GROUP BY t.year, t.month, u.level, a.name, s.title;
+""")
+
+
 # QUERY LISTS
 
-create_table_queries = [staging_events_table_create, staging_songs_table_create, user_table_create, song_table_create, artist_table_create, time_table_create, songplay_table_create]
-drop_table_queries = [staging_events_table_drop, staging_songs_table_drop, songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop]
+create_table_queries = [staging_events_table_create, staging_songs_table_create, user_table_create, song_table_create, artist_table_create, time_table_create, songplay_table_create, watermark_table_create, loaded_objects_table_create]
+final_table_creates = {'songplay': songplay_table_create, 'users': user_table_create, 'song': song_table_create, 'artist': artist_table_create, 'time': time_table_create}
+drop_table_queries = [staging_events_table_drop, staging_songs_table_drop, songplay_table_drop, user_table_drop, song_table_drop, artist_table_drop, time_table_drop, watermark_table_drop, loaded_objects_table_drop]
 copy_table_queries = [staging_events_copy, staging_songs_copy]
+chunk_copy_queries = [staging_events_chunks_copy, staging_songs_chunks_copy]
+manifest_copy_queries = [('staging_events', config['S3']['LOG_DATA'], staging_events_manifest_copy), ('staging_songs', config['S3']['SONG_DATA'], staging_songs_manifest_copy)]
 insert_table_queries = [songplay_table_insert, user_table_insert, song_table_insert, artist_table_insert, time_table_insert]
+# the same inserts as a dag: table -> (query, tables it reads that must be loaded first)
+insert_table_dag = {
+    'songplay': (songplay_table_insert, []),
+    'users': (user_table_insert, []),
+    'song': (song_table_insert, []),
+    'artist': (artist_table_insert, []),
+    'time': (time_table_insert, ['songplay']),
+}
+truncate_staging_queries = {'staging_events': staging_events_truncate, 'staging_songs': staging_songs_truncate}
+merge_table_queries = [song_table_merge_delete, song_table_insert, artist_table_merge_delete, artist_table_insert, user_table_merge_delete, user_table_merge_insert, songplay_table_append, time_table_append]
 validate_staging_queries = [staging_events_rows, staging_songs_rows]
 validate_insert_queries = [songplay_rows, users_rows, song_rows, artist_rows, time_rows]
\ No newline at end of file
@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+def run_node(connect, name, query):
+    """
+        Description: runs one query of the dag on its own connection and commits it.
+
+        Parameters:
+            connect : function returning a new connection to the data warehouse
+            name    : the node of the dag
+            query   : the query of the node
+
+        Returns:
+            dict with the node, rows affected and seconds taken
+    """
+    start = time.time()
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+
+    return {'node': name, 'rows': rows, 'seconds': round(time.time() - start, 3)}
+
+
+def run_dag(connect, dag, parallelism=4):
+    """
+        Description: runs the queries of a dag, each as soon as the nodes it depends on are done, with at most parallelism of them at once (each holds a connection and a WLM query slot).
+
+        Parameters:
+            connect     : function returning a new connection to the data warehouse
+            dag         : dict of node -> (query, list of the nodes it depends on)
+            parallelism : maximum number of queries running at once
+
+        Returns:
+            list of the results of the nodes, in completion order
+    """
+    unknown = {dep for query, deps in dag.values() for dep in deps} - set(dag)
+    if unknown:
+        raise ValueError('unknown dependencies: {}'.format(', '.join(sorted(unknown))))
+
+    waiting = dict(dag)
+    done = set()
+    failed = {}
+    results = []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        while waiting or running:
+            for name, (query, deps) in list(waiting.items()):
+                if any(dep in failed for dep in deps):
+                    failed[name] = 'skipped, a dependency failed'
+                    del waiting[name]
+                elif all(dep in done for dep in deps):
+                    running[executor.submit(run_node, connect, name, query)] = name
+                    del waiting[name]
+
+            if not running:
+                if waiting:
+                    raise ValueError('dependency cycle between: {}'.format(', '.join(sorted(waiting))))
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    results.append(future.result())
+                    done.add(name)
+                except Exception as e:
+                    failed[name] = str(e).strip().splitlines()[0]
+
+    for name, error in failed.items():
+        print('{} failed: {}'.format(name, error))
+    if failed:
+        raise RuntimeError('{} of {} nodes failed: {}'.format(len(failed), len(dag), ', '.join(failed)))
+
+    return results
+
+
+def critical_path(dag, results):
+    """
+        Description: returns the longest chain of dependent nodes by their measured durations, the lower bound of the dag's wall-clock time.
+
+        Parameters:
+            dag     : dict of node -> (query, list of the nodes it depends on)
+            results : the results of run_dag
+
+        Returns:
+            list of the nodes of the path and its seconds
+    """
+    seconds = {r['node']: r['seconds'] for r in results}
+    paths = {}
+
+    def path(name):
+        if name not in paths:
+            query, deps = dag[name]
+            longest = max((path(dep) for dep in deps), key=lambda p: p[1], default=([], 0))
+            paths[name] = (longest[0] + [name], longest[1] + seconds[name])
+        return paths[name]
+
+    return max((path(name) for name in dag), key=lambda p: p[1])
+
+
+def print_report(dag, results, seconds):
+    """
+        Description: prints the rows and seconds of every node, the wall-clock time of the dag against the sum of its nodes and its critical path.
+    """
+    for r in results:
+        print('{:<12} {:>10} rows {:>10.3f}s'.format(r['node'], r['rows'], r['seconds']))
+    nodes, path_seconds = critical_path(dag, results)
+    print('wall clock {:.3f}s, sum of nodes {:.3f}s, critical path {} {:.3f}s'.format(
+        seconds, sum(r['seconds'] for r in results), ' -> '.join(nodes), path_seconds))